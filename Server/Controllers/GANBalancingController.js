@@ -1,101 +1,116 @@
-import { execFile } from "child_process";
 import Dataset from "../Models/Dataset.js";
 import path from "path";
 import fs from "fs/promises";
+import { fileURLToPath } from "url";
+import { intermediateExtension, ganCompiledMode } from "../Services/pipelineConfig.js";
+import { PythonWorker } from "../Services/pythonWorker.js";
+import { cachedStage } from "../Services/resultCache.js";
+import { StageError, submitJob, respondWhenDone } from "../Services/jobQueue.js";
 
-export const balanceDatasetWithGAN = async (req, res) => {
-    try {
-        // Find the most recent dataset with a preprocessedPath
-        const dataset = await Dataset.findOne({ preprocessedPath: { $exists: true } }).sort({ uploadedAt: -1 });
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
 
-        if (!dataset) {
-            console.error("No preprocessed dataset found in the database.");
-            return res.status(404).json({ error: "No preprocessed dataset found" });
-        }
+// Persistent balancing worker: the GAN modules stay loaded between requests
+const ganWorker = new PythonWorker(path.resolve(__dirname, "../GANBalancing.py"), ["--serve"], {
+    env: { KMP_DUPLICATE_LIB_OK: "TRUE" },
+});
 
-        const uploadsDir = path.resolve("uploads");
-        const datasetPath = path.resolve(uploadsDir, dataset.preprocessedPath);
+// Runs GANBalancing.py (in the persistent worker) on the most recent preprocessed dataset and records the output
+export const runGANBalancing = async (body, onProgress) => {
+    // Find the most recent dataset with a preprocessedPath
+    const dataset = await Dataset.findOne({ preprocessedPath: { $exists: true } }).sort({ uploadedAt: -1 });
 
-        // Check if the dataset file exists
-        if (!await fileExists(datasetPath)) {
-            console.error(`Dataset file not found at path: ${datasetPath}`);
-            return res.status(400).json({ error: "Dataset file not found" });
-        }
+    if (!dataset) {
+        console.error("No preprocessed dataset found in the database.");
+        throw new StageError(404, { error: "No preprocessed dataset found" });
+    }
 
-        // Define the output filename for the balanced dataset
-        const balancedFileName = `balanced_${Date.now()}.csv`;
-        const balancedOutputPath = path.resolve(uploadsDir, balancedFileName);
+    const uploadsDir = path.resolve("uploads");
+    const datasetPath = path.resolve(uploadsDir, dataset.preprocessedPath);
 
-        // Define GAN model paths
-        const generatorPath = path.resolve("GANModel", "gan_generator.pth");
-        const discriminatorPath = path.resolve("GANModel", "gan_discriminator.pth");
+    // Check if the dataset file exists
+    if (!await fileExists(datasetPath)) {
+        console.error(`Dataset file not found at path: ${datasetPath}`);
+        throw new StageError(400, { error: "Dataset file not found" });
+    }
 
-        // Check if GAN model files exist
-        if (!await fileExists(generatorPath) || !await fileExists(discriminatorPath)) {
-            console.error("GAN model files missing.");
-            return res.status(500).json({ error: "GAN model files missing" });
-        }
+    // Define GAN model paths
+    const generatorPath = path.resolve("GANModel", "gan_generator.pth");
+    const discriminatorPath = path.resolve("GANModel", "gan_discriminator.pth");
+
+    // Check if GAN model files exist
+    if (!await fileExists(generatorPath) || !await fileExists(discriminatorPath)) {
+        console.error("GAN model files missing.");
+        throw new StageError(500, { error: "GAN model files missing" });
+    }
 
-        // Path to the GAN script
-        const ganScriptPath = path.resolve("E:/7th Semester/ids/Server/GANBalancing.py");
-
-        // Run the GAN balancing Python script
-        execFile(
-            "python",
-            [ganScriptPath, datasetPath, balancedOutputPath],
-            {
-                env: { ...process.env, KMP_DUPLICATE_LIB_OK: "TRUE" },
-                maxBuffer: 1024 * 1024 * 10 // 10MB buffer
-            },
-            async (error, stdout, stderr) => {
-                if (error) {
-                    console.error("Error executing GAN script:", stderr);
-                    return res.status(500).json({
-                        error: "GAN script execution failed",
-                        details: stderr
-                    });
-                }
-
-                if (stderr) {
-                    console.warn("GAN script warnings:", stderr);
-                }
-
-                try {
-                    const output = stdout.trim();
-                    const result = JSON.parse(output);
-
-                    if (result.error) {
-                        return res.status(500).json(result);
-                    }
-
-                    // Check if the balanced dataset file was created
-                    if (await fileExists(balancedOutputPath)) {
-                        // Save the balanced dataset path in the database
-                        dataset.balancedPath = balancedFileName;
-                        await dataset.save();
-
-                        res.status(200).json({
-                            message: "Dataset balanced successfully and stored in the database",
-                            balancedFileName,
-                            ...result
-                        });
-                    } else {
-                        res.status(500).json({
-                            error: "Balanced dataset file was not created",
-                            details: result
-                        });
-                    }
-                } catch (parseError) {
-                    console.error("Error parsing GAN script output:", parseError);
-                    console.error("Raw output:", stdout);
-                    res.status(500).json({
-                        error: "Failed to parse GAN results",
-                        details: parseError.message,
-                        rawOutput: stdout
-                    });
-                }
+    // int8 graphs generate slightly different samples, so the mode is part of the cache key
+    const compiled = ganCompiledMode();
+
+    // The per-class target count is derived from the input file, so the file hash and the
+    // GAN weights identify the run; reruns reuse the stored output (see resultCache.js)
+    const { result, outputPath: balancedOutputPath, cacheHit } = await cachedStage(
+        "balance-gan",
+        {
+            inputPath: datasetPath,
+            options: { compiled },
+            dependencies: [generatorPath, discriminatorPath],
+            outputName: `balanced.${intermediateExtension()}`,
+        },
+        async (outputPath) => {
+            // Run the balancing in the persistent Python worker
+            let output;
+            try {
+                output = await ganWorker.request(
+                    {
+                        dataset_path: datasetPath,
+                        output_path: outputPath,
+                        generator_path: generatorPath,
+                        discriminator_path: discriminatorPath,
+                        compiled,
+                    },
+                    { onProgress }
+                );
+            } catch (error) {
+                console.error("Error executing GAN script:", error.message);
+                throw new StageError(500, {
+                    error: "GAN script execution failed",
+                    details: error.message
+                });
             }
-        );
+
+            if (output.error) {
+                throw new StageError(500, output);
+            }
+
+            // Check if the balanced dataset file was created
+            if (!await fileExists(outputPath)) {
+                throw new StageError(500, {
+                    error: "Balanced dataset file was not created",
+                    details: output
+                });
+            }
+            return output;
+        }
+    );
+    const balancedFileName = path.relative(uploadsDir, balancedOutputPath);
+
+    // Save the balanced dataset path in the database
+    dataset.balancedPath = balancedFileName;
+    await dataset.save();
+
+    return {
+        message: "Dataset balanced successfully and stored in the database",
+        balancedFileName,
+        cacheHit,
+        ...result
+    };
+};
+
+export const balanceDatasetWithGAN = async (req, res) => {
+    try {
+        const job = submitJob("balance-gan", (onProgress) => runGANBalancing(req.body, onProgress));
+        await respondWhenDone(res, job);
     } catch (err) {
         console.error("Error in GAN controller:", err);
         res.status(500).json({ error: "Server error", details: err.message });
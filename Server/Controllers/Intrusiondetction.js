@@ -1,73 +1,108 @@
-import { exec } from "child_process";
 import path from "path";
 import fs from "fs/promises";
 import { fileURLToPath } from "url";
 import Dataset from "../Models/Dataset.js"; // Database model for dataset info
+import { PythonWorker } from "../Services/pythonWorker.js";
+import { cachedStage } from "../Services/resultCache.js";
+import { categoryModelPath, positiveInteger, nonNegativeInteger, workerCount } from "../Services/pipelineConfig.js";
+import { StageError, submitJob, respondWhenDone } from "../Services/jobQueue.js";
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
-export const detectIntrusions = async (req, res) => {
-    try {
-        // Find the most recent dataset with a balanced file
-        const datasetRecord = await Dataset.findOne({ balancedPath: { $exists: true } }).sort({ uploadedAt: -1 });
+// Define model and script paths
+const modelPath = path.resolve(__dirname, "../binary_xgboost_model/binary_xgboost_model.pkl");
+const pythonScript = path.resolve(__dirname, "../detection_script.py");
 
-        if (!datasetRecord || !datasetRecord.balancedPath) {
-            return res.status(400).json({ error: "No balanced dataset found in the database" });
-        }
+// Shared detection worker: started on first use, restarted if it exits
+const detectionWorker = new PythonWorker(pythonScript, ["--serve"]);
 
-        const uploadsDir = path.resolve("uploads");
-        const balancedDatasetPath = path.resolve(uploadsDir, datasetRecord.balancedPath);
+// Runs detection on the most recent balanced dataset in the shared Python worker
+export const runDetection = async (body, onProgress) => {
+    const {
+        previewSize: requestedPreviewSize,
+        exportFormat,
+        categoryMode = "cascade",
+        chunkSize: requestedChunkSize = process.env.DETECTION_CHUNKSIZE,
+        workers: requestedWorkers = process.env.DETECTION_WORKERS,
+    } = body || {};
+    const previewSize = nonNegativeInteger(requestedPreviewSize) ?? 10;
+    const chunkSize = positiveInteger(requestedChunkSize);
+    const workers = workerCount(requestedWorkers);
 
-        // Check if the balanced dataset file exists
-        if (!await fileExists(balancedDatasetPath)) {
-            return res.status(400).json({ error: `Balanced dataset file not found: ${datasetRecord.balancedPath}` });
-        }
+    // Find the most recent dataset with a balanced file
+    const datasetRecord = await Dataset.findOne({ balancedPath: { $exists: true } }).sort({ uploadedAt: -1 });
+
+    if (!datasetRecord || !datasetRecord.balancedPath) {
+        throw new StageError(400, { error: "No balanced dataset found in the database" });
+    }
 
-        // Define model and script paths
-        const modelPath = path.resolve(__dirname, "../binary_xgboost_model/binary_xgboost_model.pkl");
-        const pythonScript = path.resolve(__dirname, "../detection_script.py");
+    const uploadsDir = path.resolve("uploads");
+    const balancedDatasetPath = path.resolve(uploadsDir, datasetRecord.balancedPath);
 
-        // Construct the command for executing the Python intrusion detection script
-        const command = `python "${pythonScript}" "${balancedDatasetPath}" "${modelPath}"`;
+    // Check if the balanced dataset file exists
+    if (!await fileExists(balancedDatasetPath)) {
+        throw new StageError(400, { error: `Balanced dataset file not found: ${datasetRecord.balancedPath}` });
+    }
 
-        console.log(`[INFO] Executing command: ${command}`);
+    console.log(`[INFO] Running intrusion detection on: ${balancedDatasetPath}`);
 
-        // Execute the Python script
-        exec(command, { maxBuffer: 1024 * 1024 * 10 }, async (error, stdout, stderr) => {
-            if (error) {
-                console.error(`[ERROR] Execution Failed: ${error.message}`);
-                return res.status(500).json({ error: "Error executing intrusion detection script", details: error.message });
-            }
+    // With a category model configured, results also carry the attack category
+    const categoryModel = categoryModelPath();
 
-            // Log stderr for debugging (won't affect stdout JSON parsing)
-            if (stderr) {
-                console.log(`[PYTHON LOG] ${stderr}`);
-            }
+    // Preprocessing pipeline fitted for this dataset (used to align features to the model)
+    let artifactsPath;
+    if (datasetRecord.artifactsPath) {
+        artifactsPath = path.resolve(uploadsDir, datasetRecord.artifactsPath);
+        if (!await fileExists(artifactsPath)) artifactsPath = undefined;
+    }
 
-            try {
-                // Attempt to parse the output as JSON
-                const jsonStartIndex = stdout.indexOf('{');
-                if (jsonStartIndex === -1) {
-                    throw new Error("No JSON object found in output");
-                }
-                
-                // Extract only the JSON part of the output
-                const jsonOutput = stdout.substring(jsonStartIndex);
-                const result = JSON.parse(jsonOutput);
-                
-                return res.json(result);
-            } catch (parseError) {
-                console.error(`[ERROR] Parsing Output Failed: ${parseError.message}`);
-                console.error(`[ERROR] Raw stdout: ${stdout.substring(0, 200)}...`); // Log first 200 chars
-                
-                return res.status(500).json({ 
-                    error: "Error parsing intrusion detection results", 
-                    details: parseError.message,
-                    rawOutput: stdout.substring(0, 500) // Include part of raw output for debugging
-                });
+    // chunkSize and workers change how the work is split, not the result, so they are
+    // left out of the cache key
+    try {
+        const { result, cacheHit } = await cachedStage(
+            "detect-intrusion",
+            {
+                inputPath: balancedDatasetPath,
+                options: { previewSize, exportFormat, categoryMode: categoryModel ? categoryMode : undefined },
+                dependencies: [modelPath, ...(categoryModel ? [categoryModel] : []), ...(artifactsPath ? [artifactsPath] : [])],
+                // The export is kept in this entry, so a cache hit always has its file
+                outputName: exportFormat ? `detections.${exportFormat}` : undefined,
+            },
+            async (exportPath) => {
+                // Run detection in the persistent Python worker (model stays loaded between requests)
+                const output = await detectionWorker.request(
+                    {
+                        dataset_path: balancedDatasetPath,
+                        model_path: modelPath,
+                        preview_size: previewSize,
+                        export_format: exportFormat,
+                        export_path: exportPath,
+                        chunksize: chunkSize,
+                        workers,
+                        artifacts_path: artifactsPath,
+                        category_model_path: categoryModel,
+                        category_mode: categoryMode,
+                    },
+                    { onProgress }
+                );
+                // Failed runs are returned as before but not cached
+                if (output.error) throw Object.assign(new Error(output.error), { detectionResult: output });
+                return output;
             }
-        });
+        );
+        return { ...result, cacheHit };
+    } catch (err) {
+        if (!err.detectionResult) throw err;
+        console.error(`[ERROR] Detection Failed: ${err.message}`);
+        return err.detectionResult;
+    }
+};
+
+export const detectIntrusions = async (req, res) => {
+    try {
+        const job = submitJob("detect-intrusion", (onProgress) => runDetection(req.body, onProgress));
+        await respondWhenDone(res, job);
     } catch (err) {
         console.error(`[ERROR] Internal Server Error: ${err.message}`);
         return res.status(500).json({ error: "Internal server error", details: err.message });
@@ -1,12 +1,21 @@
 import Dataset from '../Models/Dataset.js';
-import { exec } from 'child_process';
 import path from 'path';
 import { fileURLToPath } from 'url';
+import { ensureAnalysis } from '../Services/datasetAnalysis.js';
+import { setCacheReferences } from '../Services/resultCache.js';
 
 // Manually define __dirname
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
+// Stage outputs recorded on datasets live in the result cache; keep them from being evicted
+setCacheReferences(async () => {
+    const datasets = await Dataset.find({}, { preprocessedPath: 1, balancedPath: 1, artifactsPath: 1 }).lean();
+    return datasets
+        .flatMap((dataset) => [dataset.preprocessedPath, dataset.balancedPath, dataset.artifactsPath])
+        .filter(Boolean);
+});
+
 export const uploadDataset = async (req, res) => {
     try {
         const { originalname, size, path: uploadedFilePath } = req.file;
@@ -21,24 +30,20 @@ export const uploadDataset = async (req, res) => {
         });
         await dataset.save();
 
-        // Analyze the dataset using the Python script
-        const pythonScript = path.join(__dirname, '../analyze_dataset.py');
+        // Analyze the dataset once, with column statistics, and store the result with the record
         const absolutePath = path.resolve(__dirname, '../uploads', relativePath);
-        const command = `python "${pythonScript}" "${absolutePath}"`;
-
-        exec(command, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error analyzing dataset: ${stderr}`);
-                return res.status(500).json({ error: "Dataset analysis failed", details: stderr });
-            }
 
-            const analysis = JSON.parse(stdout);
+        try {
+            const analysis = await ensureAnalysis(dataset, absolutePath, { columnStats: true });
             res.status(201).json({
                 message: 'Dataset uploaded and analyzed successfully',
                 dataset,
                 analysis,
             });
-        });
+        } catch (error) {
+            console.error(error.message);
+            return res.status(500).json({ error: "Dataset analysis failed", details: error.message });
+        }
     } catch (err) {
         res.status(500).json({ error: 'Failed to upload dataset', details: err.message });
     }
@@ -49,23 +54,12 @@ export const getAllDatasets = async (req, res) => {
     try {
         const datasets = await Dataset.find();
 
+        // Stored analyses are reused; only new or changed files are re-analyzed (with bounded concurrency)
         const datasetsWithAnalysis = await Promise.all(
             datasets.map(async (dataset) => {
                 // Construct the absolute path to the file
                 const absolutePath = path.resolve(__dirname, '../uploads', dataset.path);
-
-                const pythonScript = path.join(__dirname, '../analyze_dataset.py');
-                const command = `python "${pythonScript}" "${absolutePath}"`;
-
-                const analysisResult = await new Promise((resolve, reject) => {
-                    exec(command, (error, stdout, stderr) => {
-                        if (error) {
-                            reject(`Error analyzing dataset: ${stderr}`);
-                        } else {
-                            resolve(JSON.parse(stdout));
-                        }
-                    });
-                });
+                const analysisResult = await ensureAnalysis(dataset, absolutePath);
 
                 return {
                     ...dataset.toObject(),
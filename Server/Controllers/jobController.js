@@ -0,0 +1,78 @@
+import { submitJob, getJob, serializeJob } from "../Services/jobQueue.js";
+import { runPreprocessing } from "./preprocessing.js";
+import { runGANBalancing } from "./GANBalancingController.js";
+import { runDetection } from "./Intrusiondetction.js";
+import { runPipeline } from "./pipelineController.js";
+
+// Stages that can be run as background jobs, keyed by the same names as their routes
+const stageRunners = {
+    preprocess: runPreprocessing,
+    "balance-gan": runGANBalancing,
+    "detect-intrusion": runDetection,
+    pipeline: runPipeline,
+};
+
+const isFinished = (job) => job.status === "completed" || job.status === "failed";
+
+// Submit a stage and return the job id immediately
+export const createJob = (req, res) => {
+    const { stage } = req.params;
+    const runStage = stageRunners[stage];
+    if (!runStage) {
+        return res.status(404).json({ error: `Unknown pipeline stage: ${stage}` });
+    }
+
+    const body = req.body || {};
+    const job = submitJob(stage, (onProgress) => runStage(body, onProgress));
+
+    res.status(202).json({
+        jobId: job.id,
+        status: job.status,
+        statusUrl: `/datasets/jobs/${job.id}`,
+        eventsUrl: `/datasets/jobs/${job.id}/events`,
+        resultUrl: `/datasets/jobs/${job.id}/result`,
+    });
+};
+
+export const getJobStatus = (req, res) => {
+    const job = getJob(req.params.id);
+    if (!job) return res.status(404).json({ error: "Job not found" });
+    res.json(serializeJob(job));
+};
+
+// Server-sent events: the current state, then every update until the job finishes
+export const streamJobEvents = (req, res) => {
+    const job = getJob(req.params.id);
+    if (!job) return res.status(404).json({ error: "Job not found" });
+
+    res.writeHead(200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        Connection: "keep-alive",
+    });
+
+    const send = (state) => {
+        res.write(`data: ${JSON.stringify(state)}\n\n`);
+        if (isFinished(state)) {
+            job.events.off("update", send);
+            res.end();
+        }
+    };
+
+    job.events.on("update", send);
+    req.on("close", () => job.events.off("update", send));
+    send(serializeJob(job));
+};
+
+export const getJobResult = (req, res) => {
+    const job = getJob(req.params.id);
+    if (!job) return res.status(404).json({ error: "Job not found" });
+
+    if (!isFinished(job)) {
+        return res.status(202).json(serializeJob(job));
+    }
+    if (job.status === "failed") {
+        return res.status(job.errorStatus).json(job.error);
+    }
+    res.json(job.result);
+};
@@ -0,0 +1,130 @@
+import path from "path";
+import fs from "fs/promises";
+import { fileURLToPath } from "url";
+import Dataset from "../Models/Dataset.js";
+import { intermediateExtension, ganCompiledMode, categoryModelPath, positiveInteger, nonNegativeInteger, workerCount } from "../Services/pipelineConfig.js";
+import { runPythonScript } from "../Services/pythonRunner.js";
+import { cachedStage } from "../Services/resultCache.js";
+import { StageError, submitJob, respondWhenDone } from "../Services/jobQueue.js";
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+const pythonScript = path.resolve(__dirname, "../pipeline.py");
+const modelPath = path.resolve(__dirname, "../binary_xgboost_model/binary_xgboost_model.pkl");
+const generatorPath = path.resolve("GANModel", "gan_generator.pth");
+const discriminatorPath = path.resolve("GANModel", "gan_discriminator.pth");
+
+// Runs preprocess -> balance -> detect for the named dataset in one Python process.
+// Intermediate datasets are only written (and recorded on the dataset) when
+// writeIntermediates is set, e.g. to rerun a single stage afterwards.
+export const runPipeline = async (body, onProgress) => {
+    const {
+        dataset,
+        missingValueHandling,
+        featureScaling,
+        encodingCategorical,
+        featureSelection,
+        previewSize: requestedPreviewSize,
+        exportFormat,
+        writeIntermediates = false,
+        categoryMode = "cascade",
+        chunkSize: requestedChunkSize = process.env.DETECTION_CHUNKSIZE,
+        workers: requestedWorkers = process.env.DETECTION_WORKERS,
+    } = body || {};
+    const previewSize = nonNegativeInteger(requestedPreviewSize) ?? 10;
+    const chunkSize = positiveInteger(requestedChunkSize);
+    const workers = workerCount(requestedWorkers);
+
+    const datasetRecord = await Dataset.findOne({ name: dataset });
+    if (!datasetRecord) {
+        throw new StageError(400, { error: `Dataset not found: ${dataset}` });
+    }
+
+    const uploadsDir = path.resolve("uploads");
+    const datasetPath = path.resolve(uploadsDir, datasetRecord.path);
+    if (!await fileExists(datasetPath)) {
+        throw new StageError(400, { error: `Dataset file not found: ${dataset}` });
+    }
+
+    const options = { missingValueHandling, featureScaling, encodingCategorical, featureSelection };
+    const args = [datasetPath, JSON.stringify(options), "--model", modelPath, "--preview-size", String(previewSize)];
+    if (exportFormat) args.push("--export", exportFormat);
+    if (chunkSize) args.push("--chunksize", String(chunkSize));
+    if (workers > 1) args.push("--workers", String(workers));
+    const compiled = ganCompiledMode();
+    if (compiled) args.push("--compiled", compiled);
+    const categoryModel = categoryModelPath();
+    if (categoryModel) args.push("--category-model", categoryModel, "--category-mode", categoryMode);
+
+    let preprocessedFileName;
+    let balancedFileName;
+    if (writeIntermediates) {
+        const extension = intermediateExtension();
+        preprocessedFileName = `preprocessed_${Date.now()}.${extension}`;
+        balancedFileName = `balanced_${Date.now()}.${extension}`;
+        args.push("--preprocessed-output", path.join(uploadsDir, preprocessedFileName));
+        args.push("--balanced-output", path.join(uploadsDir, balancedFileName));
+    }
+
+    const run = async () => {
+        let result;
+        try {
+            result = await runPythonScript(pythonScript, args, { env: { KMP_DUPLICATE_LIB_OK: "TRUE" }, onProgress });
+        } catch (err) {
+            console.error(`[ERROR] Pipeline Failed: ${err.stderr || err.message}`);
+            throw new StageError(500, { error: "Python script execution failed", details: err.stderr || err.message });
+        }
+        if (result.error) {
+            throw new StageError(500, result);
+        }
+        return result;
+    };
+
+    console.log(`[INFO] Running pipeline on: ${datasetPath}`);
+
+    // Runs that only return JSON are cached like the single stages (see resultCache.js)
+    let output;
+    let cacheHit = false;
+    if (writeIntermediates) {
+        output = await run();
+        datasetRecord.preprocessedPath = preprocessedFileName;
+        datasetRecord.balancedPath = balancedFileName;
+        // The fitted pipeline is saved next to the preprocessed file; detection loads it from here
+        datasetRecord.artifactsPath = path.relative(uploadsDir, output.preprocess.artifactsPath);
+        await datasetRecord.save();
+    } else {
+        ({ result: output, cacheHit } = await cachedStage(
+            "pipeline",
+            {
+                inputPath: datasetPath,
+                options: { ...options, previewSize, exportFormat, compiled, categoryMode: categoryModel ? categoryMode : undefined },
+                dependencies: [modelPath, generatorPath, discriminatorPath, ...(categoryModel ? [categoryModel] : [])],
+            },
+            run
+        ));
+    }
+
+    return { ...output, preprocessedFileName, balancedFileName, cacheHit };
+};
+
+export const runFullPipeline = async (req, res) => {
+    try {
+        const job = submitJob("pipeline", (onProgress) => runPipeline(req.body, onProgress));
+        await respondWhenDone(res, job);
+    } catch (err) {
+        console.error(`[ERROR] Internal Server Error: ${err.message}`);
+        res.status(500).json({ error: "Pipeline failed", details: err.message });
+    }
+};
+
+// Helper function to check if a file exists
+const fileExists = async (filePath) => {
+    try {
+        await fs.access(filePath);
+        return true;
+    } catch (err) {
+        console.error(`File not found at path: ${filePath}`, err);
+        return false;
+    }
+};
@@ -1,69 +1,81 @@
 import path from "path";
 import fs from "fs";
-import { exec } from "child_process";
 import { fileURLToPath } from "url";
 import Dataset from "../Models/Dataset.js";
+import { intermediateExtension } from "../Services/pipelineConfig.js";
+import { runPythonScript } from "../Services/pythonRunner.js";
+import { cachedStage } from "../Services/resultCache.js";
+import { StageError, submitJob, respondWhenDone } from "../Services/jobQueue.js";
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
-export const preprocessDataset = async (req, res) => {
-  try {
-    const {
-      missingValueHandling,
-      featureScaling,
-      encodingCategorical,
-      featureSelection,
-      dataset,
-    } = req.body;
+// Runs prepro.py for the named dataset and records the output on its record
+export const runPreprocessing = async (body, onProgress) => {
+  const {
+    missingValueHandling,
+    featureScaling,
+    encodingCategorical,
+    featureSelection,
+    dataset,
+  } = body;
 
-    const datasetRecord = await Dataset.findOne({ name: dataset });
-    if (!datasetRecord) {
-      return res.status(400).json({ error: `Dataset not found: ${dataset}` });
-    }
+  const datasetRecord = await Dataset.findOne({ name: dataset });
+  if (!datasetRecord) {
+    throw new StageError(400, { error: `Dataset not found: ${dataset}` });
+  }
 
-    const uploadsDir = path.resolve("uploads");
-    const datasetPath = path.resolve(uploadsDir, datasetRecord.path);
+  const uploadsDir = path.resolve("uploads");
+  const datasetPath = path.resolve(uploadsDir, datasetRecord.path);
 
-    if (!fs.existsSync(datasetPath)) {
-      return res.status(400).json({ error: `Dataset file not found: ${dataset}` });
-    }
+  if (!fs.existsSync(datasetPath)) {
+    throw new StageError(400, { error: `Dataset file not found: ${dataset}` });
+  }
 
-    const preprocessedFileName = `preprocessed_${Date.now()}.csv`;
-    const outputFilePath = path.resolve(uploadsDir, preprocessedFileName);
+  const options = {
+    missingValueHandling,
+    featureScaling,
+    encodingCategorical,
+    featureSelection,
+  };
 
-    const options = JSON.stringify({
-      missingValueHandling,
-      featureScaling,
-      encodingCategorical,
-      featureSelection,
-    });
-    const escapedOptions = options.replace(/"/g, '\\"');
+  const pythonScript = path.resolve(__dirname, "../prepro.py");
 
-    const pythonScript = path.resolve(__dirname, "../prepro.py");
-    const command = `python "${pythonScript}" "${datasetPath}" "${escapedOptions}" "${outputFilePath}"`;
+  // Reruns with the same file and options reuse the stored output (see resultCache.js)
+  const { result: output, outputPath, cacheHit } = await cachedStage(
+    "preprocess",
+    { inputPath: datasetPath, options, outputName: `preprocessed.${intermediateExtension()}` },
+    async (outputFilePath) => {
+      let result;
+      try {
+        result = await runPythonScript(pythonScript, [datasetPath, JSON.stringify(options), outputFilePath], { onProgress });
+      } catch (err) {
+        console.error(`[ERROR] Preprocessing Failed: ${err.stderr || err.message}`);
+        throw new StageError(500, { error: "Python script execution failed", details: err.stderr || err.message });
+      }
 
-    exec(command, async (error, stdout, stderr) => {
-      if (error) {
-        console.error(`[ERROR] Preprocessing Failed: ${stderr}`);
-        return res.status(500).json({ error: "Python script execution failed", details: stderr });
+      if (result.error) {
+        throw new StageError(500, result);
       }
+      return result;
+    }
+  );
 
-      try {
-        const jsonOutput = stdout.split("\n").find((line) => line.startsWith("{"));
-        if (!jsonOutput) throw new Error("No valid JSON output from Python script.");
-        const output = JSON.parse(jsonOutput);
+  const preprocessedFileName = path.relative(uploadsDir, outputPath);
+  datasetRecord.preprocessedPath = preprocessedFileName;
+  // The fitted pipeline is written next to the output; detection loads it from here
+  datasetRecord.artifactsPath = output.artifactsPath ? path.relative(uploadsDir, output.artifactsPath) : undefined;
+  await datasetRecord.save();
 
-        datasetRecord.preprocessedPath = preprocessedFileName;
-        await datasetRecord.save();
+  output.preprocessedFileName = preprocessedFileName;
+  output.cacheHit = cacheHit;
+  return output;
+};
 
-        output.preprocessedFileName = preprocessedFileName;
-        res.status(200).json(output);
-      } catch (parseErr) {
-        console.error(`[ERROR] Parsing Output Failed: ${parseErr.message}`);
-        res.status(500).json({ error: "Failed to parse Python output", details: parseErr.message });
-      }
-    });
+export const preprocessDataset = async (req, res) => {
+  try {
+    const job = submitJob("preprocess", (onProgress) => runPreprocessing(req.body, onProgress));
+    await respondWhenDone(res, job);
   } catch (err) {
     console.error(`[ERROR] Internal Server Error: ${err.message}`);
     res.status(500).json({ error: "Preprocessing failed", details: err.message });
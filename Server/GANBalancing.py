@@ -1,16 +1,27 @@
-import sys
 import os
+import sys
 import torch
 import pandas as pd
 import torch.nn as nn
 import numpy as np
 import json
+import logging
+import argparse
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import mean_squared_error
+from data_io import read_table, write_table
+from profiling import peak_rss_mb, StageTimings
+from model_registry import registry
+from progress import report_progress, set_progress_context
+from gan_metrics import evaluate_synthetic_data, DEFAULT_MMD_SAMPLE_SIZE
 
 latent_dim = 100
 input_dim = 42
 
+# Trained weights, relative to the Server directory the scripts run from
+GENERATOR_PATH = os.path.join("GANModel", "gan_generator.pth")
+DISCRIMINATOR_PATH = os.path.join("GANModel", "gan_discriminator.pth")
+
 # Generator
 class Generator(nn.Module):
     def __init__(self, latent_dim, output_dim):
@@ -43,107 +54,167 @@ class Discriminator(nn.Module):
     def forward(self, x):
         return self.model(x)
 
-# Function to load models
-def load_models(generator_path, discriminator_path):
+def load_generator(path):
     generator = Generator(latent_dim, input_dim)
+    generator.load_state_dict(torch.load(path))
+    return generator.eval()
+
+def load_discriminator(path):
     discriminator = Discriminator(input_dim)
-    generator.load_state_dict(torch.load(generator_path))
-    discriminator.load_state_dict(torch.load(discriminator_path))
-    generator.eval()
-    discriminator.eval()
+    discriminator.load_state_dict(torch.load(path))
+    return discriminator.eval()
+
+# Function to load models (cached in the shared model registry until the files change).
+# compiled="int8" loads the exported, quantized TorchScript graphs instead (see gan_export.py)
+def load_models(generator_path, discriminator_path, compiled=None):
+    if compiled:
+        from gan_export import load_compiled_models
+        return load_compiled_models(generator_path, discriminator_path, quantize=compiled == "int8")
+    generator = registry.load(generator_path, load_generator, kind="generator")
+    discriminator = registry.load(discriminator_path, load_discriminator, kind="discriminator")
     return generator, discriminator
 
+# Defaults for batched synthesis: samples generated per batch, and candidates generated
+# per required sample (the best-scored candidates are kept)
+DEFAULT_BATCH_SIZE = 8192
+DEFAULT_OVERSAMPLE_RATIO = 2.0
+
+def select_top_samples(generator, discriminator, n_select, n_candidates, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Generate n_candidates samples in batches and return the n_select the discriminator
+    scores highest, in ascending score order.
+
+    Only the current best n_select plus one batch are held at a time: candidates below
+    the running threshold are dropped as they arrive, and the buffer is partitioned
+    back down to n_select whenever it fills.
+    """
+    output_dim = input_dim
+    capacity = n_select + batch_size
+    samples = np.empty((capacity, output_dim), dtype=np.float32)
+    scores = np.empty(capacity, dtype=np.float32)
+    filled = 0
+    threshold = -np.inf
+
+    def compact(filled):
+        keep = np.argpartition(scores[:filled], filled - n_select)[filled - n_select:]
+        samples[:n_select] = samples[keep]
+        scores[:n_select] = scores[keep]
+        return n_select, scores[:n_select].min()
+
+    remaining = n_candidates
+    with torch.inference_mode():
+        while remaining > 0:
+            current_batch = min(batch_size, remaining)
+            remaining -= current_batch
+
+            batch = generator(torch.randn((current_batch, latent_dim)))
+            batch_scores = discriminator(batch).numpy().ravel()
+            batch = batch.numpy()
+
+            keep = batch_scores > threshold
+            if filled + keep.sum() > capacity:
+                filled, threshold = compact(filled)
+                keep = batch_scores > threshold
+
+            count = int(keep.sum())
+            samples[filled:filled + count] = batch[keep]
+            scores[filled:filled + count] = batch_scores[keep]
+            filled += count
+
+    if filled > n_select:
+        filled, _ = compact(filled)
+
+    order = np.argsort(scores[:filled], kind="stable")
+    return samples[order]
+
+def class_counts(df):
+    """Rows per attack_cat, leaving out categories with no rows."""
+    counts = df['attack_cat'].value_counts()
+    return counts[counts > 0]
+
 # Function to generate synthetic data
-def generate_synthetic_data(generator, discriminator, test_df, target_count):
-    features = test_df.drop(columns=['label', 'attack_cat'])
+def generate_synthetic_data(generator, discriminator, test_df, target_count,
+                            batch_size=DEFAULT_BATCH_SIZE, oversample_ratio=DEFAULT_OVERSAMPLE_RATIO):
+    if oversample_ratio < 1:
+        raise ValueError("oversample_ratio must be at least 1")
+
+    feature_columns = test_df.columns.drop(['label', 'attack_cat'])
     scaler = MinMaxScaler(feature_range=(-1, 1))
-    normalized_features = scaler.fit_transform(features)
+    scaler.fit(test_df[feature_columns])
 
-    original_class_counts = test_df['attack_cat'].value_counts()
+    original_class_counts = class_counts(test_df)
     minority_classes = original_class_counts[lambda x: x < target_count].index.tolist()
-    balanced_test_df = test_df.copy()
     synthetic_samples_list = []
     class_generation_summary = {}
 
-    for minority_class in minority_classes:
-        minority_samples = test_df[test_df['attack_cat'] == minority_class]
-        samples_to_generate = target_count - len(minority_samples)
-        noise = torch.randn((samples_to_generate * 2, latent_dim))
-        synthetic_samples = generator(noise).detach()
+    for class_index, minority_class in enumerate(minority_classes):
+        report_progress("balance", "generate", class_index / max(len(minority_classes), 1),
+                        attack_cat=minority_class)
+        original_count = int(original_class_counts[minority_class])
+        samples_to_generate = int(target_count - original_count)
+        n_candidates = int(np.ceil(samples_to_generate * oversample_ratio))
 
-        discriminator_score = discriminator(synthetic_samples).detach().numpy().flatten()
-        top_indices = discriminator_score.argsort()[-samples_to_generate:]
-        selected_samples = synthetic_samples[top_indices].numpy()
+        selected_samples = select_top_samples(
+            generator, discriminator, samples_to_generate, n_candidates, batch_size
+        )
 
-        synthetic_df = pd.DataFrame(selected_samples, columns=features.columns)
-        synthetic_df['label'] = 1
-        synthetic_df['attack_cat'] = minority_class
-        balanced_test_df = pd.concat([balanced_test_df, synthetic_df], ignore_index=True)
+        synthetic_df = pd.DataFrame(selected_samples, columns=feature_columns)
+        # Match test_df's dtypes so the final concat does not upcast label or attack_cat
+        synthetic_df['label'] = pd.Series(1, index=synthetic_df.index, dtype=test_df['label'].dtype)
+        synthetic_df['attack_cat'] = pd.Series(minority_class, index=synthetic_df.index,
+                                               dtype=test_df['attack_cat'].dtype)
         synthetic_samples_list.append(synthetic_df)
 
         class_generation_summary[minority_class] = {
-            "original_count": len(minority_samples),
+            "original_count": original_count,
             "generated_count": samples_to_generate,
-            "total_count_after_generation": len(minority_samples) + samples_to_generate
+            "total_count_after_generation": original_count + samples_to_generate
         }
 
-    return balanced_test_df, synthetic_samples_list, scaler, class_generation_summary
-
-# Main script
-if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python GANBalancing.py <dataset_path> <output_path>")
-        sys.exit(1)
-
-    dataset_path = sys.argv[1]
-    output_path = sys.argv[2]
-
-    # Define model paths within the script
-    generator_path = os.path.join("GANModel", "gan_generator.pth")
-    discriminator_path = os.path.join("GANModel", "gan_discriminator.pth")
-
-    # Load models
-    generator, discriminator = load_models(generator_path, discriminator_path)
-
-    # Load and process the dataset
-    test_df = pd.read_csv(dataset_path)
-    target_count = test_df['attack_cat'].value_counts().max()
-
-    balanced_test_df, synthetic_samples_list, scaler, class_generation_summary = generate_synthetic_data(
-        generator, discriminator, test_df, target_count
-    )
-
-    real_data = torch.tensor(scaler.transform(test_df.drop(columns=['label', 'attack_cat']).values), dtype=torch.float32)
-    synthetic_data = torch.tensor(np.vstack([sample.drop(columns=['label', 'attack_cat']).values for sample in synthetic_samples_list]), dtype=torch.float32)
+    # Single concatenation once every class has been generated
+    balanced_test_df = pd.concat([test_df, *synthetic_samples_list], ignore_index=True)
 
-    avg_cosine_similarity = np.mean([
-        np.dot(real_data[i], synthetic_data[i]) / (np.linalg.norm(real_data[i]) * np.linalg.norm(synthetic_data[i]))
-        for i in range(min(real_data.shape[0], synthetic_data.shape[0]))
-    ])
+    return balanced_test_df, synthetic_samples_list, scaler, class_generation_summary
 
-    # Calculate discriminator scores
-    real_discriminator_score = discriminator(real_data).detach().numpy().flatten()
-    synthetic_discriminator_score = discriminator(synthetic_data).detach().numpy().flatten()
+def balance_dataset(generator, discriminator, test_df, batch_size=DEFAULT_BATCH_SIZE,
+                    oversample_ratio=DEFAULT_OVERSAMPLE_RATIO, mmd_sample_size=DEFAULT_MMD_SAMPLE_SIZE,
+                    timings=None, metrics_discriminator=None):
+    """
+    Balance an in-memory dataset up to its largest class and evaluate the generated samples.
+    metrics_discriminator scores the evaluation metrics instead of discriminator (the
+    eager module when generating with compiled graphs, so the report is not approximated).
+    Returns (balanced frame, summary dict).
+    """
+    timings = timings or StageTimings()
+    target_count = class_counts(test_df).max()
 
-    # Ensure both arrays have the same length
-    min_length = min(len(real_discriminator_score), len(synthetic_discriminator_score))
-    real_discriminator_score = real_discriminator_score[:min_length]
-    synthetic_discriminator_score = synthetic_discriminator_score[:min_length]
+    with timings.stage("generate"):
+        balanced_test_df, synthetic_samples_list, scaler, class_generation_summary = generate_synthetic_data(
+            generator, discriminator, test_df, target_count,
+            batch_size=batch_size, oversample_ratio=oversample_ratio
+        )
+    timings.add_rows("generate", len(balanced_test_df) - len(test_df))
 
-    # Calculate average discriminator score (difference between real and synthetic)
-    avg_discriminator_score = np.mean(real_discriminator_score - synthetic_discriminator_score)
+    feature_columns = test_df.columns.drop(['label', 'attack_cat'])
+    real_data = scaler.transform(test_df[feature_columns]).astype(np.float32)
+    if synthetic_samples_list:
+        synthetic_data = np.vstack([sample[feature_columns].to_numpy(dtype=np.float32) for sample in synthetic_samples_list])
+    else:
+        synthetic_data = np.empty((0, len(feature_columns)), dtype=np.float32)
 
-    # Update evaluation metrics
-    evaluation_metrics = {
-        "cosine_similarity": float(avg_cosine_similarity),
-        "discriminator_score": float(avg_discriminator_score)
-    }
+    # Batched, vectorized quality metrics (no autograd)
+    report_progress("balance", "metrics", 0.9)
+    with timings.stage("metrics", rows=len(real_data) + len(synthetic_data)):
+        evaluation_metrics = evaluate_synthetic_data(
+            discriminator if metrics_discriminator is None else metrics_discriminator, real_data, synthetic_data, feature_names=list(feature_columns),
+            batch_size=batch_size, mmd_sample_size=mmd_sample_size
+        )
 
     # Count samples per class before and after generation
-    original_class_counts = test_df['attack_cat'].value_counts().to_dict()
-    generated_class_counts = balanced_test_df['attack_cat'].value_counts().to_dict()
+    original_class_counts = {cls: int(count) for cls, count in class_counts(test_df).items()}
+    generated_class_counts = {cls: int(count) for cls, count in class_counts(balanced_test_df).items()}
 
-    final_output = {
+    summary = {
         "evaluation_metrics": evaluation_metrics,
         "class_generation_summary": class_generation_summary,
         "class_counts_before_generation": original_class_counts,
@@ -154,9 +225,131 @@ if __name__ == "__main__":
             "total_generated": len(balanced_test_df) - len(test_df)
         }
     }
+    return balanced_test_df, summary
+
+def balance_file(dataset_path, output_path, generator_path=GENERATOR_PATH, discriminator_path=DISCRIMINATOR_PATH,
+                 batch_size=DEFAULT_BATCH_SIZE, oversample_ratio=DEFAULT_OVERSAMPLE_RATIO,
+                 mmd_sample_size=DEFAULT_MMD_SAMPLE_SIZE, compiled=None):
+    """Balance the dataset at dataset_path, write it to output_path and return the summary."""
+    timings = StageTimings()
+
+    # Load models
+    report_progress("balance", "load", 0.0)
+    with timings.stage("load_model"):
+        generator, discriminator = load_models(generator_path, discriminator_path, compiled=compiled)
+        # Quality metrics always come from the eager discriminator
+        metrics_discriminator = load_models(generator_path, discriminator_path)[1] if compiled else None
+
+    # Load and process the dataset
+    with timings.stage("load"):
+        test_df = read_table(dataset_path, optimize=True)
+    timings.add_rows("load", len(test_df))
+
+    balanced_test_df, final_output = balance_dataset(
+        generator, discriminator, test_df, batch_size=batch_size,
+        oversample_ratio=oversample_ratio, mmd_sample_size=mmd_sample_size, timings=timings,
+        metrics_discriminator=metrics_discriminator
+    )
+    final_output["memory"] = {"peak_rss_mb": peak_rss_mb()}
 
     # Save balanced dataset
-    balanced_test_df.to_csv(output_path, index=False)
+    report_progress("balance", "write", 0.95)
+    with timings.stage("write", rows=len(balanced_test_df)):
+        write_table(balanced_test_df, output_path)
+    report_progress("balance", "done", 1.0)
+    final_output["timings"] = timings.as_dict()
+    final_output["model_cache"] = registry.stats()
+    if compiled:
+        from gan_export import export_report
+        final_output["compiled_graphs"] = export_report(generator_path, discriminator_path, compiled == "int8")
+    return final_output
+
+def serve(input_stream, output_stream):
+    """
+    Run as a long-lived worker speaking JSON lines, like detection_script.serve.
+
+    Each request line is {"id": ..., "dataset_path": ..., "output_path": ...}, plus the
+    optional "generator_path", "discriminator_path", "batch_size", "oversample_ratio",
+    "mmd_sample_size" and "compiled" keys, and is answered with {"id": ..., "result": {...}}.
+    The GAN modules stay loaded between requests (see model_registry).
+    {"command": "stats"} returns the model cache statistics and {"command": "shutdown"}
+    ends the loop.
+    """
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            response = {"id": None, "result": {"error": f"Invalid request: {str(e)}"}}
+        else:
+            if request.get("command") == "shutdown":
+                break
+            set_progress_context(request_id=request.get("id"))
+            try:
+                result = handle_request(request)
+            except Exception as e:
+                logging.error(f"Balancing failed: {type(e).__name__}: {str(e)}")
+                result = {"error": f"{type(e).__name__}: {str(e)}"}
+            response = {"id": request.get("id"), "result": result}
+
+        output_stream.write(json.dumps(response) + "\n")
+        output_stream.flush()
+
+def handle_request(request):
+    """Answer one serve() request other than shutdown."""
+    if request.get("command") == "stats":
+        return registry.stats()
+    return balance_file(
+        request["dataset_path"], request["output_path"],
+        generator_path=request.get("generator_path") or GENERATOR_PATH,
+        discriminator_path=request.get("discriminator_path") or DISCRIMINATOR_PATH,
+        batch_size=request.get("batch_size") or DEFAULT_BATCH_SIZE,
+        oversample_ratio=request.get("oversample_ratio") or DEFAULT_OVERSAMPLE_RATIO,
+        mmd_sample_size=request.get("mmd_sample_size") or DEFAULT_MMD_SAMPLE_SIZE,
+        compiled=request.get("compiled")
+    )
+
+# Main script
+if __name__ == "__main__":
+    # Logs (e.g. gan_export parity warnings) go to stderr; stdout carries the JSON result
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    parser = argparse.ArgumentParser(description="Balance a dataset with GAN-generated minority samples.")
+    parser.add_argument("dataset_path", nargs="?")
+    parser.add_argument("output_path", nargs="?")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Samples generated and scored per batch")
+    parser.add_argument("--oversample-ratio", type=float, default=DEFAULT_OVERSAMPLE_RATIO,
+                        help="Candidates generated per required sample; the best-scored are kept")
+    parser.add_argument("--mmd-sample-size", type=int, default=DEFAULT_MMD_SAMPLE_SIZE,
+                        help="Rows sampled from each side for the MMD estimate")
+    parser.add_argument("--compiled", choices=["int8"],
+                        help="Generate with the exported int8 TorchScript graphs; graphs that fail "
+                             "their parity check fall back to eager (see gan_export.py)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a persistent worker reading JSON-line requests from stdin")
+    args = parser.parse_args()
+
+    if args.serve:
+        # Keep stdout reserved for protocol messages; stray prints go to stderr
+        protocol_out = sys.stdout
+        sys.stdout = sys.stderr
+        serve(sys.stdin, protocol_out)
+        sys.exit(0)
+
+    if not args.dataset_path or not args.output_path:
+        sys.stderr.write("Usage: python GANBalancing.py <dataset_path> <output_path>\n")
+        sys.exit(1)
+
+    final_output = balance_file(
+        args.dataset_path, args.output_path, batch_size=args.batch_size,
+        oversample_ratio=args.oversample_ratio, mmd_sample_size=args.mmd_sample_size, compiled=args.compiled
+    )
 
     # Print JSON output
-    print(json.dumps(final_output, indent=4))
\ No newline at end of file
+    print(json.dumps(final_output, indent=4))
@@ -6,6 +6,10 @@ const datasetSchema = new mongoose.Schema({
     path: { type: String, required: true }, // Path to the uploaded file
     preprocessedPath: { type: String },
     balancedPath: { type: String },
+    artifactsPath: { type: String }, // Preprocessing pipeline fitted by prepro.py, reused by detection
+    analysis: { type: Object }, // Cached analyze_dataset.py output
+    analysisFileKey: { type: String }, // "<size>-<mtimeMs>" of the file when analysis was computed
+    fileHash: { type: String }, // SHA-256 of the file contents
     uploadedAt: { type: Date, default: Date.now },
 });
 
@@ -4,6 +4,8 @@ import { uploadDataset, getAllDatasets } from '../Controllers/datasetController.
 import { preprocessDataset } from '../Controllers/preprocessing.js';
 import { balanceDatasetWithGAN } from '../Controllers/GANBalancingController.js';
 import { detectIntrusions } from '../Controllers/Intrusiondetction.js';
+import { runFullPipeline } from '../Controllers/pipelineController.js';
+import { createJob, getJobStatus, streamJobEvents, getJobResult } from '../Controllers/jobController.js';
 
 
 
@@ -31,5 +33,14 @@ router.post('/balance-gan', balanceDatasetWithGAN);
 
 router.post('/detect-intrusion',detectIntrusions);
 
+// Preprocess, balance and detect in one Python process
+router.post('/pipeline', runFullPipeline);
+
+// Background jobs: submit a stage, then poll/stream progress and fetch the result
+router.post('/jobs/:stage', createJob);
+router.get('/jobs/:id', getJobStatus);
+router.get('/jobs/:id/events', streamJobEvents);
+router.get('/jobs/:id/result', getJobResult);
+
 
 export default router;
\ No newline at end of file
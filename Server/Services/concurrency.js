@@ -0,0 +1,24 @@
+// Minimal concurrency limiter: at most `limit` tasks run at once, the rest wait in FIFO order.
+export const createLimiter = (limit) => {
+    let active = 0;
+    const queue = [];
+
+    const next = () => {
+        if (active >= limit || queue.length === 0) return;
+        active++;
+        const { task, resolve, reject } = queue.shift();
+        Promise.resolve()
+            .then(task)
+            .then(resolve, reject)
+            .finally(() => {
+                active--;
+                next();
+            });
+    };
+
+    return (task) =>
+        new Promise((resolve, reject) => {
+            queue.push({ task, resolve, reject });
+            next();
+        });
+};
@@ -0,0 +1,69 @@
+import { exec } from "child_process";
+import { createHash } from "crypto";
+import { createReadStream } from "fs";
+import fs from "fs/promises";
+import os from "os";
+import path from "path";
+import { fileURLToPath } from "url";
+import { createLimiter } from "./concurrency.js";
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+const pythonScript = path.join(__dirname, "../analyze_dataset.py");
+
+// Caps how many files are hashed and analyzed (analyze_dataset.py) at once
+const analysisLimit = createLimiter(
+    Number(process.env.ANALYSIS_CONCURRENCY) || Math.max(1, Math.floor(os.cpus().length / 2))
+);
+
+// Streaming SHA-256 of a file, so large uploads are never held in memory
+export const hashFile = (filePath) =>
+    new Promise((resolve, reject) => {
+        const hash = createHash("sha256");
+        createReadStream(filePath)
+            .on("data", (chunk) => hash.update(chunk))
+            .on("end", () => resolve(hash.digest("hex")))
+            .on("error", reject);
+    });
+
+// Without columnStats only the target column is read, which is several times faster
+const runAnalysis = (absolutePath, columnStats) =>
+    new Promise((resolve, reject) => {
+        const command = `python "${pythonScript}" "${absolutePath}"${columnStats ? "" : " --no-column-stats"}`;
+        exec(command, (error, stdout, stderr) => {
+            if (error) {
+                reject(new Error(`Error analyzing dataset: ${stderr}`));
+            } else {
+                resolve(JSON.parse(stdout));
+            }
+        });
+    });
+
+// Return the dataset's analysis, recomputing it only when the file has changed.
+// Size + mtime is the cheap check; if it differs the content hash decides whether
+// the stored analysis is still valid. Updated results are saved on the record.
+// columnStats adds per-column statistics (a full read of the file); uploads ask for
+// them once, listings of changed files only refresh the class counts.
+export const ensureAnalysis = async (dataset, absolutePath, { columnStats = false } = {}) => {
+    const stats = await fs.stat(absolutePath);
+    const fileKey = `${stats.size}-${stats.mtimeMs}`;
+
+    if (dataset.analysis && dataset.analysisFileKey === fileKey) {
+        return dataset.analysis;
+    }
+
+    // Hashing reads the whole file too, so it shares the limit with the analysis;
+    // listing many changed datasets then reads them a few at a time
+    await analysisLimit(async () => {
+        const fileHash = await hashFile(absolutePath);
+        if (!dataset.analysis || dataset.fileHash !== fileHash) {
+            dataset.analysis = await runAnalysis(absolutePath, columnStats);
+            dataset.fileHash = fileHash;
+        }
+    });
+    dataset.analysisFileKey = fileKey;
+    await dataset.save();
+
+    return dataset.analysis;
+};
@@ -0,0 +1,97 @@
+import { randomUUID } from "crypto";
+import { EventEmitter } from "events";
+import { createLimiter } from "./concurrency.js";
+
+// Error carrying the HTTP status and JSON body a failed stage should respond with
+export class StageError extends Error {
+    constructor(status, payload) {
+        super(payload.error);
+        this.status = status;
+        this.payload = payload;
+    }
+}
+
+// Finished jobs are kept this long so their results can still be fetched
+const JOB_TTL_MS = Number(process.env.JOB_TTL_MS) || 60 * 60 * 1000;
+
+const jobs = new Map();
+const stageLimiters = new Map();
+
+// Concurrent jobs per stage: JOB_CONCURRENCY_<STAGE> (e.g. JOB_CONCURRENCY_BALANCE_GAN),
+// falling back to JOB_CONCURRENCY, then 1
+const stageLimit = (stage) => {
+    const stageKey = `JOB_CONCURRENCY_${stage.toUpperCase().replace(/[^A-Z0-9]/g, "_")}`;
+    return Number(process.env[stageKey]) || Number(process.env.JOB_CONCURRENCY) || 1;
+};
+
+const limiterFor = (stage) => {
+    if (!stageLimiters.has(stage)) {
+        stageLimiters.set(stage, createLimiter(stageLimit(stage)));
+    }
+    return stageLimiters.get(stage);
+};
+
+export const serializeJob = (job) => ({
+    id: job.id,
+    stage: job.stage,
+    status: job.status,
+    progress: job.progress,
+    error: job.error,
+    createdAt: job.createdAt,
+    startedAt: job.startedAt,
+    finishedAt: job.finishedAt,
+});
+
+// Queue `task(onProgress)` under the stage's concurrency limit. The returned job has an
+// `events` emitter ("update" on every change) and a `done` promise that never rejects.
+export const submitJob = (stage, task) => {
+    const job = {
+        id: randomUUID(),
+        stage,
+        status: "queued",
+        progress: null,
+        result: null,
+        error: null,
+        errorStatus: null,
+        createdAt: new Date(),
+        startedAt: null,
+        finishedAt: null,
+        events: new EventEmitter(),
+    };
+    jobs.set(job.id, job);
+
+    const update = (fields) => {
+        Object.assign(job, fields);
+        job.events.emit("update", serializeJob(job));
+    };
+
+    job.done = limiterFor(stage)(async () => {
+        update({ status: "running", startedAt: new Date() });
+        try {
+            const result = await task((progress) => update({ progress }));
+            update({ status: "completed", result, finishedAt: new Date() });
+        } catch (err) {
+            console.error(`[ERROR] Job ${job.id} (${stage}) failed: ${err.message}`);
+            update({
+                status: "failed",
+                error: err.payload || { error: err.message },
+                errorStatus: err.status || 500,
+                finishedAt: new Date(),
+            });
+        }
+        setTimeout(() => jobs.delete(job.id), JOB_TTL_MS).unref();
+    });
+
+    return job;
+};
+
+export const getJob = (id) => jobs.get(id);
+
+// Run a stage as a job and answer the request once it finishes (the synchronous endpoints)
+export const respondWhenDone = async (res, job, successStatus = 200) => {
+    await job.done;
+    if (job.status === "failed") {
+        return res.status(job.errorStatus).json(job.error);
+    }
+    return res.status(successStatus).json(job.result);
+};
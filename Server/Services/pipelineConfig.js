@@ -0,0 +1,44 @@
+import os from "os";
+import path from "path";
+
+// Settings shared by the pipeline stage controllers.
+// Read lazily so values from .env (loaded in index.js) are picked up.
+
+const INTERMEDIATE_FORMATS = ["csv", "parquet", "feather"];
+
+// File extension for datasets handed between stages (preprocess -> balance -> detect).
+// The Python scripts pick the reader/writer from the extension; CSV stays the default.
+export const intermediateExtension = () => {
+    const format = (process.env.PIPELINE_FORMAT || "csv").toLowerCase();
+    return INTERMEDIATE_FORMATS.includes(format) ? format : "csv";
+};
+
+// Positive integer from a request or env value (e.g. "5000"), otherwise undefined
+export const positiveInteger = (value) => {
+    const number = Math.floor(Number(value));
+    return Number.isFinite(number) && number > 0 ? number : undefined;
+};
+
+// Non-negative integer from a request value (e.g. "5" or 0), otherwise undefined
+export const nonNegativeInteger = (value) => {
+    if (value === null || value === "") return undefined;
+    const number = Math.floor(Number(value));
+    return Number.isFinite(number) && number >= 0 ? number : undefined;
+};
+
+// Detection worker processes for a request or env value, clamped to 1..CPU count
+export const workerCount = (value) => Math.min(positiveInteger(value) || 1, os.cpus().length);
+
+// Optional attack category model for detection (see detection_script.py --category-model),
+// relative to the server's working directory like the other model paths
+export const categoryModelPath = () =>
+    process.env.DETECTION_CATEGORY_MODEL ? path.resolve(process.env.DETECTION_CATEGORY_MODEL) : undefined;
+
+// fp32 graphs are slower than the eager modules here and are only exported for parity tests
+const GAN_COMPILED_MODES = ["int8"];
+
+// Exported TorchScript graphs for the GAN (see gan_export.py): "int8" or unset for eager modules
+export const ganCompiledMode = () => {
+    const mode = (process.env.GAN_COMPILED || "").toLowerCase();
+    return GAN_COMPILED_MODES.includes(mode) ? mode : undefined;
+};
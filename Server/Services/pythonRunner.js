@@ -0,0 +1,67 @@
+import { spawn } from "child_process";
+import readline from "readline";
+
+// Prefix of the structured progress lines the Python stages write to stderr (see progress.py)
+export const PROGRESS_PREFIX = "@@PROGRESS ";
+
+// Number of trailing stderr lines kept for error reports
+const STDERR_TAIL_LINES = 50;
+
+// Returns the progress event on a stderr line, or null for ordinary log output
+export const parseProgressLine = (line) => {
+    if (!line.startsWith(PROGRESS_PREFIX)) return null;
+    try {
+        return JSON.parse(line.substring(PROGRESS_PREFIX.length));
+    } catch (err) {
+        return null;
+    }
+};
+
+// Run a Python script to completion and resolve with the JSON object it prints on stdout.
+// stdout is streamed into memory without a fixed buffer limit; progress events on stderr
+// are passed to onProgress and everything else on stderr is logged.
+export const runPythonScript = (scriptPath, args = [], { env, cwd, onProgress } = {}) =>
+    new Promise((resolve, reject) => {
+        const child = spawn("python", [scriptPath, ...args], {
+            env: { ...process.env, ...env },
+            cwd,
+        });
+
+        const stdoutChunks = [];
+        const stderrTail = [];
+
+        child.stdout.on("data", (chunk) => stdoutChunks.push(chunk));
+
+        readline.createInterface({ input: child.stderr }).on("line", (line) => {
+            const event = parseProgressLine(line);
+            if (event) {
+                if (onProgress) onProgress(event);
+                return;
+            }
+            console.log(`[PYTHON LOG] ${line}`);
+            stderrTail.push(line);
+            if (stderrTail.length > STDERR_TAIL_LINES) stderrTail.shift();
+        });
+
+        child.on("error", reject);
+
+        child.on("close", (code) => {
+            const stdout = Buffer.concat(stdoutChunks).toString();
+            const stderr = stderrTail.join("\n");
+
+            if (code !== 0) {
+                const error = new Error(`Python script exited with code ${code}`);
+                error.stderr = stderr;
+                return reject(error);
+            }
+
+            // The scripts log to stderr only, so stdout is exactly one JSON document
+            try {
+                resolve(JSON.parse(stdout));
+            } catch (parseError) {
+                parseError.stderr = stderr;
+                parseError.rawOutput = stdout.substring(0, 500);
+                reject(parseError);
+            }
+        });
+    });
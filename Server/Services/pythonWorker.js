@@ -0,0 +1,88 @@
+import { spawn } from "child_process";
+import readline from "readline";
+import { parseProgressLine } from "./pythonRunner.js";
+
+// Long-lived Python process speaking JSON lines over stdin/stdout.
+// Requests are tagged with an id so responses can be matched back to callers.
+export class PythonWorker {
+    constructor(scriptPath, args = [], options = {}) {
+        this.scriptPath = scriptPath;
+        this.args = args;
+        this.options = options;
+        this.process = null;
+        this.pending = new Map();
+        this.nextId = 1;
+    }
+
+    start() {
+        if (this.process) return;
+
+        const child = spawn("python", [this.scriptPath, ...this.args], {
+            env: { ...process.env, ...this.options.env },
+            stdio: ["pipe", "pipe", "pipe"],
+        });
+        this.process = child;
+
+        readline.createInterface({ input: child.stdout }).on("line", (line) => {
+            let message;
+            try {
+                message = JSON.parse(line);
+            } catch (err) {
+                console.error(`[ERROR] Invalid worker output: ${line.substring(0, 200)}`);
+                return;
+            }
+
+            const request = this.pending.get(message.id);
+            if (request) {
+                this.pending.delete(message.id);
+                request.resolve(message.result);
+            }
+        });
+
+        // Progress events carry the request id they belong to; other lines are logs
+        readline.createInterface({ input: child.stderr }).on("line", (line) => {
+            const event = parseProgressLine(line);
+            if (!event) {
+                console.log(`[PYTHON LOG] ${line}`);
+                return;
+            }
+            const request = this.pending.get(event.request_id);
+            if (request && request.onProgress) request.onProgress(event);
+        });
+
+        child.on("exit", (code, signal) => {
+            console.warn(`[WARN] Python worker exited (code: ${code}, signal: ${signal})`);
+            this.process = null;
+            // Fail in-flight requests; the next request restarts the worker
+            for (const request of this.pending.values()) {
+                request.reject(new Error("Python worker exited before responding"));
+            }
+            this.pending.clear();
+        });
+
+        child.on("error", (err) => {
+            console.error(`[ERROR] Python worker failed: ${err.message}`);
+        });
+
+        // Writing to a worker that has just died raises EPIPE on stdin; the exit
+        // handler above already fails the pending requests
+        child.stdin.on("error", (err) => {
+            console.error(`[ERROR] Python worker stdin: ${err.message}`);
+        });
+    }
+
+    request(payload, { onProgress } = {}) {
+        this.start();
+        const id = this.nextId++;
+
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject, onProgress });
+            this.process.stdin.write(`${JSON.stringify({ id, ...payload })}\n`);
+        });
+    }
+
+    stop() {
+        if (!this.process) return;
+        this.process.stdin.write(`${JSON.stringify({ command: "shutdown" })}\n`);
+    }
+}
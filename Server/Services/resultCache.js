@@ -0,0 +1,177 @@
+import { createHash } from "crypto";
+import fs from "fs/promises";
+import path from "path";
+import { fileURLToPath } from "url";
+import { hashFile } from "./datasetAnalysis.js";
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+// Content-addressed cache of stage results under uploads/cache/<key>/.
+// The key hashes the stage name, the input file's contents, the stage options, the
+// model files the stage uses and the Python sources, so any change to those gives a
+// new entry. Each entry holds the stage's output file(s) plus result.json, which is
+// written last and marks the entry as complete.
+const CACHE_DIR = path.resolve("uploads", "cache");
+const RESULT_FILE = "result.json";
+
+// Total size kept on disk; least recently used entries are removed beyond it. 0 disables the cache.
+const maxCacheBytes = () => {
+    const configured = process.env.RESULT_CACHE_MAX_BYTES;
+    return configured === undefined ? 5 * 1024 ** 3 : Number(configured);
+};
+
+// File hashes memoized by path, size and mtime so unchanged files are hashed once
+const fileHashes = new Map();
+
+const hashFileCached = async (filePath) => {
+    const stats = await fs.stat(filePath);
+    const memoKey = `${filePath}:${stats.size}:${stats.mtimeMs}`;
+    if (!fileHashes.has(memoKey)) {
+        fileHashes.set(memoKey, await hashFile(filePath));
+    }
+    return fileHashes.get(memoKey);
+};
+
+// Version of the Python code: a hash of every script the stages run
+let codeVersion = null;
+
+const getCodeVersion = async () => {
+    if (!codeVersion) {
+        const serverDir = path.resolve(__dirname, "..");
+        const scripts = (await fs.readdir(serverDir)).filter((name) => name.endsWith(".py")).sort();
+        const hash = createHash("sha256");
+        for (const name of scripts) {
+            hash.update(name);
+            hash.update(await hashFileCached(path.join(serverDir, name)));
+        }
+        codeVersion = hash.digest("hex");
+    }
+    return codeVersion;
+};
+
+const inFlight = new Map();
+
+// Returns the files other records still point at (e.g. a dataset's preprocessedPath);
+// cache entries holding one of them are never evicted. Set with setCacheReferences.
+let referencedFiles = async () => [];
+
+export const setCacheReferences = (provider) => {
+    referencedFiles = provider;
+};
+
+// Keys of the cache entries that contain any of the referenced files
+const referencedKeys = async () => {
+    const keys = new Set();
+    for (const filePath of await referencedFiles()) {
+        const relative = path.relative(CACHE_DIR, path.resolve("uploads", filePath));
+        if (relative && !relative.startsWith("..") && !path.isAbsolute(relative)) {
+            keys.add(relative.split(path.sep)[0]);
+        }
+    }
+    return keys;
+};
+
+const exists = async (filePath) => {
+    try {
+        await fs.access(filePath);
+        return true;
+    } catch {
+        return false;
+    }
+};
+
+const directorySize = async (dir) => {
+    let total = 0;
+    for (const entry of await fs.readdir(dir, { withFileTypes: true })) {
+        const entryPath = path.join(dir, entry.name);
+        total += entry.isDirectory() ? await directorySize(entryPath) : (await fs.stat(entryPath)).size;
+    }
+    return total;
+};
+
+// Remove least recently used entries until the cache fits in maxCacheBytes().
+// Entries still referenced by a record are kept even if the cache stays over the limit.
+const evict = async (keep) => {
+    const referenced = await referencedKeys();
+    const entries = [];
+    for (const key of await fs.readdir(CACHE_DIR)) {
+        const dir = path.join(CACHE_DIR, key);
+        try {
+            const lastUsed = (await fs.stat(path.join(dir, RESULT_FILE))).mtimeMs;
+            entries.push({ key, dir, lastUsed, size: await directorySize(dir) });
+        } catch {
+            // Incomplete entry (still being computed or failed); left alone
+        }
+    }
+
+    let total = entries.reduce((sum, entry) => sum + entry.size, 0);
+    entries.sort((a, b) => a.lastUsed - b.lastUsed);
+    for (const entry of entries) {
+        if (total <= maxCacheBytes()) break;
+        if (entry.key === keep || inFlight.has(entry.key) || referenced.has(entry.key)) continue;
+        await fs.rm(entry.dir, { recursive: true, force: true });
+        total -= entry.size;
+        console.log(`[INFO] Evicted cached result ${entry.key}`);
+    }
+};
+
+// Run `compute(outputPath)` for a stage, or return its stored result when the same input,
+// options, models and code were seen before. `outputName` is the file the stage writes
+// (omit it for stages that only return JSON). compute must throw on failure so that
+// errors are not cached. Resolves with { result, outputPath, cacheHit }.
+export const cachedStage = async (stage, { inputPath, options = {}, dependencies = [], outputName }, compute) => {
+    if (maxCacheBytes() <= 0) {
+        // Uncached: a new timestamped file in uploads/ for every run
+        const { name, ext } = path.parse(outputName || "");
+        const outputPath = outputName ? path.resolve("uploads", `${name}_${Date.now()}${ext}`) : null;
+        return { result: await compute(outputPath), outputPath, cacheHit: false };
+    }
+
+    const keyHash = createHash("sha256");
+    keyHash.update(JSON.stringify({
+        stage,
+        input: await hashFileCached(inputPath),
+        options,
+        dependencies: await Promise.all(dependencies.map(hashFileCached)),
+        code: await getCodeVersion(),
+        outputName: outputName || null,
+    }));
+    const key = keyHash.digest("hex");
+
+    // Identical requests running at the same time share one computation
+    if (inFlight.has(key)) return inFlight.get(key);
+
+    const run = (async () => {
+        const dir = path.join(CACHE_DIR, key);
+        const resultPath = path.join(dir, RESULT_FILE);
+        const outputPath = outputName ? path.join(dir, outputName) : null;
+
+        if (await exists(resultPath) && (!outputPath || await exists(outputPath))) {
+            const now = new Date();
+            await fs.utimes(resultPath, now, now);
+            console.log(`[INFO] ${stage}: using cached result ${key}`);
+            return { result: JSON.parse(await fs.readFile(resultPath, "utf8")), outputPath, cacheHit: true };
+        }
+
+        await fs.rm(dir, { recursive: true, force: true });
+        await fs.mkdir(dir, { recursive: true });
+        let result;
+        try {
+            result = await compute(outputPath);
+        } catch (err) {
+            await fs.rm(dir, { recursive: true, force: true });
+            throw err;
+        }
+        await fs.writeFile(resultPath, JSON.stringify(result));
+        return { result, outputPath, cacheHit: false };
+    })();
+
+    inFlight.set(key, run);
+    try {
+        return await run;
+    } finally {
+        inFlight.delete(key);
+        await evict(key).catch((err) => console.error(`[ERROR] Result cache eviction failed: ${err.message}`));
+    }
+};
@@ -1,33 +1,78 @@
 import pandas as pd
-import sys
+import os
 import json
+import argparse
+from data_io import read_columns, iter_table_chunks
+from profiling import StageTimings
 
-def analyze_dataset(file_path, target_column=None):
+# Rows read per chunk; memory use depends on this, not on the dataset size
+DEFAULT_CHUNKSIZE = 200_000
+
+def _accumulate(running, chunk_values, combine):
+    """Combine per-column chunk aggregates into the running aggregates."""
+    if running is None:
+        return chunk_values
+    return pd.concat([running, chunk_values], axis=1).agg(combine, axis=1)
+
+def analyze_dataset(file_path, target_column=None, column_stats=True, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Summarise a dataset in a single streaming pass over fixed-size chunks.
+
+    With column_stats the whole file is read and per-column null counts (plus min,
+    max and mean for numeric columns) are gathered in the same pass. Without it only
+    the target column is read, which is several times faster on wide files.
+    Size(KB) is the on-disk file size.
+    """
     try:
-        # Load dataset and clean column names
-        df = pd.read_csv(file_path)
-        df.columns = df.columns.str.strip()  # Remove leading/trailing spaces in column names
+        # Read the header only and clean column names
+        raw_columns = read_columns(file_path)
+        columns = [str(col).strip() for col in raw_columns]  # Remove leading/trailing spaces in column names
 
         # Basic details
         dataset_name = file_path.split("/")[-1]
-        size_kb = round(df.memory_usage(deep=True).sum() / 1024, 2)
-        total_samples = len(df)
-        no_of_attributes = len(df.columns) - 1  # Exclude target column if identified
+        no_of_attributes = len(columns) - 1  # Exclude target column if identified
 
         # Identify or confirm target column
         if target_column is None:  # Check if target_column is passed or needs inference
             # Infer a probable target column
             possible_targets = ["attack_cat", "label", "class", "target"]
-            target_column = next((col for col in df.columns if col.lower() in map(str.lower, possible_targets)), None)
-        
-        if not target_column or target_column not in df.columns:
+            target_column = next((col for col in columns if col.lower() in map(str.lower, possible_targets)), None)
+
+        if not target_column or target_column not in columns:
             return {
                 "error": f"Target column not found in the dataset: {dataset_name}",
-                "available_columns": df.columns.tolist()  # Provide a hint about the dataset structure
+                "available_columns": columns  # Provide a hint about the dataset structure
             }
 
+        usecols = None if column_stats else [raw_columns[columns.index(target_column)]]
+
+        total_samples = 0
+        class_counts = None
+        null_counts = None
+        column_min = column_max = column_sum = column_count = None
+
+        timings = StageTimings()
+        for chunk in timings.iterate("load", iter_table_chunks(file_path, chunksize, columns=usecols)):
+            with timings.stage("aggregate", rows=len(chunk)):
+                chunk.columns = chunk.columns.str.strip()
+                total_samples += len(chunk)
+
+                counts = chunk[target_column].value_counts()
+                class_counts = counts if class_counts is None else class_counts.add(counts, fill_value=0)
+
+                if column_stats:
+                    null_counts = _accumulate(null_counts, chunk.isna().sum(), "sum")
+
+                    numeric = chunk.select_dtypes(include=["number"])
+                    column_min = _accumulate(column_min, numeric.min(), "min")
+                    column_max = _accumulate(column_max, numeric.max(), "max")
+                    column_sum = _accumulate(column_sum, numeric.sum(), "sum")
+                    column_count = _accumulate(column_count, numeric.count(), "sum")
+
+        size_kb = round(os.path.getsize(file_path) / 1024, 2)
+
         # Analyze classes
-        class_counts = df[target_column].value_counts().to_dict()
+        class_counts = class_counts.astype("int64").sort_values(ascending=False, kind="stable").to_dict()
         no_of_classes = len(class_counts)
 
         # Separate "Normal" class and attack classes
@@ -62,13 +107,32 @@ def analyze_dataset(file_path, target_column=None):
             "AttackClasses": attack_classes
         }
 
+        if column_stats:
+            stats = {}
+            for col in columns:
+                stats[col] = {"Nulls": int(null_counts.get(col, 0))}
+                if column_count is not None and col in column_count.index and column_count[col] > 0:
+                    stats[col].update({
+                        "Min": float(column_min[col]),
+                        "Max": float(column_max[col]),
+                        "Mean": float(column_sum[col] / column_count[col])
+                    })
+            analysis["ColumnStats"] = stats
+
+        analysis["timings"] = timings.as_dict()
         return analysis
 
     except Exception as e:
         return {"error": f"An error occurred: {str(e)}"}
 
 if __name__ == "__main__":
-    file_path = sys.argv[1]
-    target_column = sys.argv[2] if len(sys.argv) > 2 else None  # Allow passing target column via arguments
-    result = analyze_dataset(file_path, target_column)  # Pass target_column
+    parser = argparse.ArgumentParser(description="Analyze a dataset's classes and columns.")
+    parser.add_argument("file_path")
+    parser.add_argument("target_column", nargs="?", default=None)  # Allow passing target column via arguments
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--no-column-stats", dest="column_stats", action="store_false",
+                        help="Only read the target column and leave out ColumnStats")
+    args = parser.parse_args()
+
+    result = analyze_dataset(args.file_path, args.target_column, args.column_stats, args.chunksize)  # Pass target_column
     print(json.dumps(result))
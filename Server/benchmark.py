@@ -0,0 +1,265 @@
+"""
+Benchmarks for the four pipeline stages on synthetic UNSW-NB15 shaped data.
+
+Datasets are generated offline from a seed, so runs on different commits see the
+same input. Each stage runs as its own process the way the Node server invokes it,
+and its wall time, peak resident memory and throughput are written as JSON:
+
+    python benchmark.py --rows 10000 100000 --output bench_results.json
+    python benchmark.py --rows 10000 100000 --baseline bench_results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join("binary_xgboost_model", "binary_xgboost_model.pkl")
+
+STAGES = ("analyze", "preprocess", "balance", "detect")
+
+# UNSW-NB15 feature columns in file order (the id, attack_cat and label columns are added around them)
+NUMERIC_FEATURES = [
+    "dur", "spkts", "dpkts", "sbytes", "dbytes", "rate", "sttl", "dttl", "sload", "dload",
+    "sloss", "dloss", "sinpkt", "dinpkt", "sjit", "djit", "swin", "stcpb", "dtcpb", "dwin",
+    "tcprtt", "synack", "ackdat", "smean", "dmean", "trans_depth", "response_body_len",
+    "ct_srv_src", "ct_state_ttl", "ct_dst_ltm", "ct_src_dport_ltm", "ct_dst_sport_ltm",
+    "ct_dst_src_ltm", "is_ftp_login", "ct_ftp_cmd", "ct_flw_http_mthd", "ct_src_ltm",
+    "ct_srv_dst", "is_sm_ips_ports"
+]
+CATEGORICAL_VALUES = {
+    "proto": ["tcp", "udp", "arp", "ospf", "icmp", "igmp", "sctp", "unas"],
+    "service": ["-", "http", "dns", "ftp", "ftp-data", "smtp", "ssh", "pop3"],
+    "state": ["FIN", "INT", "CON", "REQ", "RST", "ECO"]
+}
+ATTACK_CATEGORIES = [
+    "Generic", "Exploits", "Fuzzers", "DoS", "Reconnaissance",
+    "Analysis", "Backdoor", "Shellcode", "Worms"
+]
+
+PREPROCESS_OPTIONS = {
+    "missingValueHandling": True,
+    "featureScaling": True,
+    "encodingCategorical": True,
+    "featureSelection": True
+}
+
+def class_proportions(normal_share, skew):
+    """
+    Class shares for Normal followed by ATTACK_CATEGORIES. Each attack class is
+    skew times rarer than the one before it, so skew=1 splits attacks evenly.
+    """
+    weights = np.power(float(skew), -np.arange(len(ATTACK_CATEGORIES)))
+    attack_shares = (1 - normal_share) * weights / weights.sum()
+    return dict(zip(["Normal", *ATTACK_CATEGORIES], [normal_share, *attack_shares]))
+
+def generate_dataset(rows, extra_columns=0, normal_share=0.4, skew=1.5, missing_rate=0.01, seed=0):
+    """
+    Build a UNSW-NB15 shaped DataFrame: heavy-tailed numeric features whose scale
+    depends on the class, the proto/service/state text columns, extra_columns
+    additional numeric columns, attack_cat and label. missing_rate of the numeric
+    values are set to NaN.
+    """
+    rng = np.random.default_rng(seed)
+    proportions = class_proportions(normal_share, skew)
+    classes = np.array(list(proportions))
+    class_codes = rng.choice(len(classes), size=rows, p=list(proportions.values()))
+
+    data = {"id": np.arange(1, rows + 1)}
+    numeric_names = NUMERIC_FEATURES + [f"extra_{i}" for i in range(extra_columns)]
+    for column_index, name in enumerate(numeric_names):
+        # Every class gets its own scale per feature so the stages see separable data
+        class_scale = rng.uniform(0.5, 2.0, size=len(classes))
+        values = rng.exponential(10.0 * (column_index % 7 + 1), size=rows) * class_scale[class_codes]
+        values[rng.random(rows) < missing_rate] = np.nan
+        data[name] = values.round(6)
+
+    for name, values in CATEGORICAL_VALUES.items():
+        data[name] = np.asarray(values)[rng.integers(len(values), size=rows)]
+
+    df = pd.DataFrame(data)
+    ordered = ["id", "dur", "proto", "service", "state", *NUMERIC_FEATURES[1:]]
+    df = df[ordered + [name for name in df.columns if name not in ordered]]
+    df["attack_cat"] = classes[class_codes]
+    df["label"] = (class_codes != 0).astype(np.int64)
+    return df
+
+def run_stage(command):
+    """
+    Run one stage script from the Server directory.
+    Returns (parsed JSON output, wall seconds, peak RSS in MB or None).
+    """
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, *command], cwd=SERVER_DIR, stdout=stdout, stderr=stderr)
+        peak_rss = None
+        if hasattr(os, "wait4"):
+            # wait4 reports the resource usage of this child alone
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            scale = 1 if sys.platform == "darwin" else 1024
+            peak_rss = round(usage.ru_maxrss * scale / (1024 * 1024), 2)
+        else:
+            process.wait()
+        elapsed = time.perf_counter() - start
+
+        stdout.seek(0)
+        output = stdout.read().decode(errors="replace")
+        stderr.seek(0)
+        errors = stderr.read().decode(errors="replace")
+
+    if process.returncode != 0:
+        raise RuntimeError(f"{command[0]} exited with {process.returncode}: {errors[-2000:]}")
+    result = json.loads(output)
+    if "error" in result:
+        raise RuntimeError(f"{command[0]} failed: {result['error']}")
+
+    if peak_rss is None:
+        peak_rss = (result.get("memory") or {}).get("peak_rss_mb")
+    return result, elapsed, peak_rss
+
+def benchmark_size(rows, workdir, args):
+    """Generate one dataset and run the selected stages on it in pipeline order."""
+    extension = args.format
+    raw_path = os.path.join(workdir, f"raw_{rows}.{extension}")
+    preprocessed_path = os.path.join(workdir, f"preprocessed_{rows}.{extension}")
+    balanced_path = os.path.join(workdir, f"balanced_{rows}.{extension}")
+
+    from data_io import write_table
+    start = time.perf_counter()
+    raw = generate_dataset(rows, args.extra_columns, args.normal_share, args.skew, seed=args.seed)
+    write_table(raw, raw_path)
+    print(f"[INFO] Generated {rows} rows in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    del raw
+
+    commands = {
+        "analyze": (["analyze_dataset.py", raw_path, "attack_cat"], lambda result: rows),
+        "preprocess": (["prepro.py", raw_path, json.dumps(PREPROCESS_OPTIONS), preprocessed_path],
+                       lambda result: rows),
+        "balance": (["GANBalancing.py", preprocessed_path, balanced_path],
+                    lambda result: result["total_samples"]["before_generation"]),
+        "detect": (["detection_script.py", balanced_path, args.model_path]
+                   + (["--chunksize", str(args.chunksize)] if args.chunksize else [])
+                   + (["--workers", str(args.workers)] if args.workers > 1 else []),
+                   lambda result: result["TotalResults"])
+    }
+
+    results = []
+    for stage in STAGES:
+        if stage not in args.stages:
+            continue
+        command, input_rows = commands[stage]
+        for repeat in range(args.repeat):
+            result, elapsed, peak_rss = run_stage(command)
+            stage_rows = int(input_rows(result))
+            results.append({
+                "stage": stage,
+                "rows": rows,
+                "stage_rows": stage_rows,
+                "repeat": repeat,
+                "wall_seconds": round(elapsed, 4),
+                "peak_rss_mb": peak_rss,
+                "rows_per_sec": round(stage_rows / elapsed, 1) if elapsed > 0 else None,
+                # The script's own per-phase breakdown (load, predict, ...)
+                "phases": (result.get("timings") or {}).get("stages")
+            })
+            print(f"[INFO] {stage:<10} rows={stage_rows:<9} {elapsed:8.2f}s "
+                  f"peak={peak_rss} MB", file=sys.stderr)
+    return results
+
+def git_commit():
+    """Current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    """Describe the machine and library versions the numbers were measured with."""
+    import sklearn
+    versions = {"python": platform.python_version(), "numpy": np.__version__,
+                "pandas": pd.__version__, "sklearn": sklearn.__version__}
+    for module in ("torch", "xgboost"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {"platform": platform.platform(), "cpu_count": os.cpu_count(), "versions": versions}
+
+def best_times(results):
+    """Fastest wall time per (stage, rows) across repeats."""
+    best = {}
+    for entry in results:
+        key = (entry["stage"], entry["rows"])
+        best[key] = min(best.get(key, float("inf")), entry["wall_seconds"])
+    return best
+
+def compare(results, baseline):
+    """Relative wall-time change per (stage, rows) against a previous results file."""
+    current = best_times(results)
+    previous = best_times(baseline["results"])
+    return [
+        {"stage": stage, "rows": rows, "baseline_seconds": previous[(stage, rows)],
+         "wall_seconds": seconds, "change": round(seconds / previous[(stage, rows)] - 1, 4)}
+        for (stage, rows), seconds in current.items()
+        if previous.get((stage, rows))
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Dataset sizes to benchmark")
+    parser.add_argument("--extra-columns", type=int, default=0,
+                        help="Numeric columns added beyond the UNSW-NB15 features")
+    parser.add_argument("--normal-share", type=float, default=0.4, help="Share of Normal rows")
+    parser.add_argument("--skew", type=float, default=1.5,
+                        help="Ratio between consecutive attack class sizes (1 = even)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--format", choices=["csv", "parquet", "feather"], default="csv",
+                        help="File format of the generated and intermediate datasets")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage and size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--chunksize", type=int, default=None, help="Detection chunk size")
+    parser.add_argument("--workers", type=int, default=1, help="Detection workers")
+    parser.add_argument("--workdir", help="Keep generated datasets here instead of a temporary directory")
+    parser.add_argument("--output", help="Write results JSON here as well as to stdout")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare wall times against")
+    args = parser.parse_args()
+
+    # Stages after the first one read the previous stage's output
+    stage_order = [stage for stage in STAGES if stage in args.stages]
+    for stage in stage_order:
+        needed = {"balance": "preprocess", "detect": "balance"}.get(stage)
+        if needed and needed not in stage_order:
+            parser.error(f"the {stage} stage needs the {needed} stage")
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        workdir = os.path.abspath(args.workdir) if args.workdir else temporary_dir
+        os.makedirs(workdir, exist_ok=True)
+        results = []
+        for rows in args.rows:
+            results.extend(benchmark_size(rows, workdir, args))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": environment(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(results, json.load(f))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,109 @@
+"""
+Reading and writing the datasets passed between pipeline stages.
+
+The format follows the file extension: .parquet, .feather/.arrow (Arrow IPC) or CSV
+for anything else. The columnar formats keep column types and full float precision
+and are read memory-mapped, so stages skip the text parsing CSV needs.
+"""
+import os
+import numpy as np
+import pandas as pd
+from schema import categorical_dtypes, optimize_dtypes
+
+TABLE_FORMATS = {
+    ".parquet": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather"
+}
+
+def table_format(path):
+    """Return "parquet", "feather" or "csv" for a dataset path."""
+    return TABLE_FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+
+def read_columns(path):
+    """Return a dataset's column names without loading its rows."""
+    file_format = table_format(path)
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    if file_format == "feather":
+        import pyarrow as pa
+        return pa.ipc.open_file(pa.memory_map(path, "r")).schema.names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+# Rows read to find which known categorical columns still hold text
+CSV_SNIFF_ROWS = 1000
+
+def _csv_dtypes(path, columns, optimize, floats=False):
+    # Parse the known categorical columns straight into category dtype, unless
+    # they were already label encoded by an earlier stage. With floats, columns
+    # that are floating point in the sample are parsed straight into float32
+    # rather than into a float64 frame that optimize_dtypes then converts.
+    if not optimize:
+        return None
+    sample = pd.read_csv(path, nrows=CSV_SNIFF_ROWS, usecols=columns)
+    text_columns = sample.columns[[not pd.api.types.is_numeric_dtype(dtype) for dtype in sample.dtypes]]
+    dtypes = categorical_dtypes(text_columns)
+    if floats:
+        dtypes.update({col: np.float32 for col, dtype in sample.dtypes.items() if pd.api.types.is_float_dtype(dtype)})
+    return dtypes
+
+def read_table(path, columns=None, optimize=False):
+    """
+    Load a whole dataset, optionally restricted to the given columns.
+    optimize=True applies the compact dtypes from schema.optimize_dtypes.
+    """
+    file_format = table_format(path)
+    if file_format == "parquet":
+        df = pd.read_parquet(path, columns=columns, memory_map=True)
+    elif file_format == "feather":
+        import pyarrow.feather as feather
+        df = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    else:
+        try:
+            df = pd.read_csv(path, usecols=columns, dtype=_csv_dtypes(path, columns, optimize, floats=True))
+        except ValueError:
+            # A column that is numeric in the sample holds text further down
+            df = pd.read_csv(path, usecols=columns, dtype=_csv_dtypes(path, columns, optimize))
+    return optimize_dtypes(df) if optimize else df
+
+def iter_table_chunks(path, chunksize, columns=None, optimize=False):
+    """Yield a dataset as DataFrames of at most chunksize rows, indexed by row position."""
+    file_format = table_format(path)
+    if file_format == "csv":
+        chunks = pd.read_csv(path, chunksize=chunksize, usecols=columns,
+                             dtype=_csv_dtypes(path, columns, optimize))
+        for df in chunks:
+            yield optimize_dtypes(df) if optimize else df
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format == "parquet":
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize, columns=columns)
+    else:
+        # Arrow IPC files are mapped rather than read, so slicing them is zero-copy
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        batches = table.to_batches(max_chunksize=chunksize)
+
+    offset = 0
+    for batch in batches:
+        df = batch.to_pandas()
+        df.index = pd.RangeIndex(offset, offset + len(df))
+        offset += len(df)
+        yield optimize_dtypes(df) if optimize else df
+
+def write_table(df, path):
+    """Write a dataset in the format implied by its extension."""
+    file_format = table_format(path)
+    if file_format == "parquet":
+        df.to_parquet(path, index=False)
+    elif file_format == "feather":
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            df = df.reset_index(drop=True)
+        df.to_feather(path)
+    else:
+        df.to_csv(path, index=False)
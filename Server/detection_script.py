@@ -1,161 +1,650 @@
 import sys
+import os
 import json
+import argparse
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import joblib
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
+from prepro import apply_preprocessing
+from data_io import read_table, iter_table_chunks
+from progress import report_progress, set_progress_context
+from profiling import peak_rss_mb, StageTimings
+from model_registry import registry
 
-def detect_intrusions(dataset_path, model_path):
+# Set up logging to stderr instead of stdout
+logging.basicConfig(stream=sys.stderr, level=logging.INFO,
+                    format='[%(levelname)s] %(message)s')
+
+# Dataset columns copied into the detection results, mapped to their display names
+RESULT_COLUMNS = {
+    'timestamp': "Timestamp",
+    'src_ip': "Source IP",
+    'dst_ip': "Destination IP",
+    'proto': "Protocol"
+}
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+# attack_cat value of benign traffic; rows the binary model passes are given this category
+NORMAL_CATEGORY = "Normal"
+
+# cascade: the category model labels only the rows the binary model flags as attacks.
+# multiclass: the category model scores every row alone; anything but Normal is an attack.
+CATEGORY_MODES = ("cascade", "multiclass")
+
+# Artifact paths already reported missing (warned about once per process)
+_missing_artifacts = set()
+
+def load_model(model_path, artifacts_path=None):
+    """
+    Load the model and its preprocessing artifacts through the shared model registry,
+    so repeated calls reuse them until the files change on disk.
+    """
+    # Load the model
+    model = registry.load(model_path, load_pickle)
+
+    # Get preprocessing artifacts path (written by prepro.py)
+    artifacts_path = artifacts_path or model_path.replace('.pkl', '_preprocessing_artifacts.pkl')
+
+    # Check if preprocessing artifacts exist
     try:
-        # Set up logging to stderr instead of stdout
-        import logging
-        logging.basicConfig(stream=sys.stderr, level=logging.INFO, 
-                           format='[%(levelname)s] %(message)s')
-        
-        # Load dataset
-        logging.info(f"Loading dataset from {dataset_path}")
-        df = pd.read_csv(dataset_path)
-        
+        preprocessing_artifacts = registry.load(artifacts_path, load_pickle)
+    except FileNotFoundError:
+        if artifacts_path not in _missing_artifacts:
+            _missing_artifacts.add(artifacts_path)
+            logging.warning("Preprocessing artifacts not found. Will attempt to continue without them.")
+        preprocessing_artifacts = None
+
+    return model, preprocessing_artifacts
+
+def load_category_model(path):
+    """
+    Load an attack category model through the registry. Returns (model, class names or None).
+
+    The file holds either an estimator whose predict() returns attack_cat names, or a
+    dict {"model": estimator, "classes": [names]} for models such as XGBoost that
+    predict class indices.
+    """
+    category_model = registry.load(path, load_pickle)
+    if isinstance(category_model, dict):
+        return category_model["model"], np.asarray(category_model["classes"], dtype=object)
+    return category_model, None
+
+def decode_categories(predictions, classes=None):
+    """Category names for a category model's predictions."""
+    predictions = np.asarray(predictions)
+    if classes is not None:
+        return classes[predictions.astype(np.int64)]
+    return predictions.astype(str).astype(object)
+
+def load_pickle(path):
+    logging.info(f"Loading {path}")
+    return joblib.load(path)
+
+def set_model_threads(model, n_jobs):
+    """
+    Set the number of threads the model's native predict uses, where supported.
+    None restores the library default (all cores).
+    """
+    if hasattr(model, 'get_booster'):
+        model.get_booster().set_param({"nthread": n_jobs or 0})
+    if hasattr(model, 'n_jobs'):
+        model.n_jobs = n_jobs
+
+def worker_count(workers):
+    """Clamp a requested worker count to 1..cpu_count."""
+    return max(1, min(int(workers or 1), os.cpu_count() or 1))
+
+def preview_count(preview_size):
+    """Validate a requested preview size (e.g. "5" from a request) as a non-negative integer."""
+    try:
+        count = int(preview_size)
+    except (TypeError, ValueError):
+        raise ValueError(f"preview_size must be a non-negative integer, got {preview_size!r}")
+    if count < 0:
+        raise ValueError(f"preview_size must be a non-negative integer, got {preview_size!r}")
+    return count
+
+# Process pool for parallel detection, reused across jobs with the same (model path, workers);
+# a request with different settings replaces it, so at most one pool is alive
+_worker_pool = None
+_worker_pool_key = None
+
+def _init_pool_worker(model_path):
+    # Each pool process scores one chunk at a time, so keep the model single-threaded
+    model, _ = load_model(model_path)
+    set_model_threads(model, 1)
+
+def _predict_chunk(model_path, features):
+    model, _ = load_model(model_path)
+    # A retrained model may have been reloaded since the worker started
+    set_model_threads(model, 1)
+    return model.predict(features)
+
+def get_worker_pool(model_path, workers):
+    """Return a process pool whose workers have the model loaded."""
+    global _worker_pool, _worker_pool_key
+    key = (model_path, workers)
+    if _worker_pool_key != key:
+        if _worker_pool is not None:
+            logging.info("Stopping the previous detection worker processes")
+            _worker_pool.shutdown(wait=True, cancel_futures=True)
+        logging.info(f"Starting {workers} detection worker processes")
+        _worker_pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_pool_worker, initargs=(model_path,)
+        )
+        _worker_pool_key = key
+    return _worker_pool
+
+def read_dataset_chunks(dataset_path, chunksize=None):
+    """Yield the dataset as DataFrames of at most chunksize rows (one frame if unset)."""
+    if chunksize:
+        chunks = iter_table_chunks(dataset_path, chunksize, optimize=True)
+    else:
+        chunks = [read_table(dataset_path, optimize=True)]
+    for df in chunks:
         # Standardize column names
         df.columns = df.columns.str.strip().str.lower()
-        
-        # Load the model
-        logging.info(f"Loading model from {model_path}")
-        model = joblib.load(model_path)
-        
-        # Get preprocessing artifacts path
-        artifacts_path = model_path.replace('.pkl', '_preprocessing_artifacts.pkl')
-        
-        # Check if preprocessing artifacts exist
-        try:
-            preprocessing_artifacts = joblib.load(artifacts_path)
-            logging.info("Loaded preprocessing artifacts successfully.")
-        except FileNotFoundError:
-            logging.warning("Preprocessing artifacts not found. Will attempt to continue without them.")
-            preprocessing_artifacts = None
-        
-        # Extract target columns if they exist
-        target_columns = [col for col in df.columns if col in ['attack_cat', 'label']]
-        
-        if target_columns:
-            targets = df[target_columns].copy()
-            features = df.drop(columns=target_columns)
+        yield df
+
+def frame_chunks(df, chunksize=None):
+    """Yield an in-memory dataset the way read_dataset_chunks yields a file."""
+    df = df.set_axis(df.columns.str.strip().str.lower(), axis=1)
+    if not chunksize:
+        yield df
+        return
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+def prepare_features(df, model, preprocessing_artifacts, preprocess=False, verbose=True):
+    """Optionally apply the fitted preprocessing pipeline, then align features to the model."""
+    if preprocess:
+        if not preprocessing_artifacts or 'numeric_cols' not in preprocessing_artifacts:
+            raise ValueError("Preprocessing requested but no fitted preprocessing pipeline was found")
+        df = apply_preprocessing(df, preprocessing_artifacts)
+    return align_features(df, model, preprocessing_artifacts, verbose=verbose)
+
+def predict_chunks(chunks, model, preprocessing_artifacts, model_path, workers=1, preprocess=False,
+                   timings=None):
+    """
+    Yield (chunk, features, predictions) for each chunk, in input order.
+
+    With more than one worker, aligned chunks are sharded across a process pool and
+    up to two chunks per worker are kept in flight while the next ones are parsed
+    (the "predict" timing is then the time spent waiting on the pool).
+    """
+    timings = timings or StageTimings()
+
+    if workers <= 1:
+        for chunk_index, df in enumerate(chunks):
+            with timings.stage("prepare", rows=len(df)):
+                features = prepare_features(df, model, preprocessing_artifacts, preprocess, chunk_index == 0)
+            with timings.stage("predict", rows=len(df)):
+                predictions = model.predict(features)
+            yield df, features, predictions
+        return
+
+    pool = get_worker_pool(model_path, workers)
+    in_flight = deque()
+
+    def next_result():
+        done_df, done_features, future = in_flight.popleft()
+        with timings.stage("predict", rows=len(done_df)):
+            return done_df, done_features, future.result()
+
+    for chunk_index, df in enumerate(chunks):
+        with timings.stage("prepare", rows=len(df)):
+            features = prepare_features(df, model, preprocessing_artifacts, preprocess, chunk_index == 0)
+        in_flight.append((df, features, pool.submit(_predict_chunk, model_path, features)))
+        if len(in_flight) >= workers * 2:
+            yield next_result()
+
+    while in_flight:
+        yield next_result()
+
+def predict_categories(category_model, classes, features, predictions):
+    """Attack categories for the rows flagged in predictions; the rest are NORMAL_CATEGORY."""
+    categories = np.full(len(features), NORMAL_CATEGORY, dtype=object)
+    flagged = np.asarray(predictions) == 1
+    if flagged.any():
+        flagged_features = align_features(features[flagged], category_model, None, verbose=False)
+        categories[flagged] = decode_categories(category_model.predict(flagged_features), classes)
+    return categories
+
+class CategoryConfusion:
+    """
+    Multi-class confusion matrix accumulated chunk by chunk.
+
+    Each update maps the true and predicted names to class codes and counts all
+    pairs with one bincount; classes seen for the first time are appended, so
+    chunks may introduce new categories.
+    """
+
+    def __init__(self, classes=()):
+        self.classes = []
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self._codes(np.asarray(list(classes), dtype=object))
+
+    def _codes(self, values):
+        values = pd.Index(values).astype(str).str.strip()
+        codes = pd.Index(self.classes).get_indexer(values)
+        if (codes < 0).any():
+            self.classes.extend(values[codes < 0].unique())
+            size = len(self.classes)
+            grown = np.zeros((size, size), dtype=np.int64)
+            grown[:len(self.counts), :len(self.counts)] = self.counts
+            self.counts = grown
+            codes = pd.Index(self.classes).get_indexer(values)
+        return codes
+
+    def update(self, y_true, y_pred):
+        true_codes = self._codes(np.asarray(y_true, dtype=object))
+        predicted_codes = self._codes(np.asarray(y_pred, dtype=object))
+        size = len(self.classes)
+        self.counts += np.bincount(true_codes * size + predicted_codes, minlength=size * size).reshape(size, size)
+
+    def summary(self):
+        """Per-class precision/recall/F1, overall and macro figures and the full matrix."""
+        counts = self.counts
+        correct = np.diag(counts)
+        support = counts.sum(axis=1)
+        predicted = counts.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, correct / predicted, 0.0)
+            recall = np.where(support > 0, correct / support, 0.0)
+            f1 = np.where(support + predicted > 0, 2 * correct / (support + predicted), 0.0)
+
+        total = int(counts.sum())
+        present = support > 0
+        return {
+            "Accuracy": f"{(correct.sum() / total if total else 0.0) * 100:.2f}%",
+            "Macro Precision": f"{precision[present].mean() * 100 if present.any() else 0.0:.2f}%",
+            "Macro Recall": f"{recall[present].mean() * 100 if present.any() else 0.0:.2f}%",
+            "Macro F1 Score": f"{f1[present].mean() * 100 if present.any() else 0.0:.2f}%",
+            "PerClass": {
+                name: {
+                    "Precision": f"{precision[i] * 100:.2f}%",
+                    "Recall": f"{recall[i] * 100:.2f}%",
+                    "F1 Score": f"{f1[i] * 100:.2f}%",
+                    "Support": int(support[i]),
+                    "Predicted": int(predicted[i])
+                }
+                for i, name in enumerate(self.classes)
+            },
+            # Rows are true classes, columns predicted classes, both in "Classes" order
+            "Classes": list(self.classes),
+            "ConfusionMatrix": counts.tolist()
+        }
+
+def build_detection_results(df, predictions, categories=None):
+    """Assemble per-row detection results column-wise from the dataset and predictions."""
+    is_attack = np.asarray(predictions) == 1
+    results = pd.DataFrame({
+        "Index": df.index.to_numpy(),
+        "Threat": np.where(is_attack, "Attack", "Normal"),
+        "Action": np.where(is_attack, "Block", "Allow")
+    })
+    if categories is not None:
+        results["Category"] = categories
+
+    # Add timestamp, IPs and protocol if available
+    for column, name in RESULT_COLUMNS.items():
+        if column in df.columns:
+            results[name] = df[column].astype(str).to_numpy()
+
+    return results
+
+class DetectionResultWriter:
+    """
+    Writes the full detection results one batch at a time, to export_path or else
+    next to the dataset.
+    """
+
+    def __init__(self, dataset_path, export_format, export_path=None):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+
+        self.export_format = export_format
+        self.path = export_path or f"{os.path.splitext(dataset_path)[0]}_detections.{export_format}"
+        self._parquet_writer = None
+        self._rows_written = 0
+
+    def write(self, results):
+        if self.export_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(results, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
         else:
-            targets = None
-            features = df.copy()
-        
-        # ALIGNMENT FIX: Check feature alignment with model
-        if hasattr(model, 'feature_names_in_'):
-            expected_features = list(model.feature_names_in_)
+            first_batch = self._rows_written == 0
+            results.to_csv(self.path, mode="w" if first_batch else "a", header=first_batch, index=False)
+        self._rows_written += len(results)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+def align_features(df, model, preprocessing_artifacts, verbose=True):
+    """Drop target columns and order the remaining features the way the model expects."""
+    # Extract target columns if they exist
+    target_columns = [col for col in df.columns if col in ['attack_cat', 'label']]
+    features = df.drop(columns=target_columns) if target_columns else df
+
+    # ALIGNMENT FIX: Check feature alignment with model
+    if hasattr(model, 'feature_names_in_'):
+        expected_features = list(model.feature_names_in_)
+        if verbose:
             logging.info(f"Model expects {len(expected_features)} features")
             logging.info(f"Dataset provides {len(features.columns)} features")
-            
-            # Check for missing features
-            missing_features = [f for f in expected_features if f not in features.columns]
-            if missing_features:
-                logging.warning(f"Missing features: {missing_features}")
-                # Add missing features with zeros
-                for feature in missing_features:
-                    features[feature] = 0
-            
-            # Reorder features to match model's expected order
-            features = features[expected_features]
-        elif preprocessing_artifacts and 'selected_features' in preprocessing_artifacts:
-            # Use the selected features from preprocessing
-            expected_features = preprocessing_artifacts['selected_features']
+    elif preprocessing_artifacts and 'selected_features' in preprocessing_artifacts:
+        # Use the selected features from preprocessing
+        expected_features = preprocessing_artifacts['selected_features']
+        if verbose:
             logging.info(f"Using {len(expected_features)} features from preprocessing")
-            
-            # Check for missing features
-            missing_features = [f for f in expected_features if f not in features.columns]
-            if missing_features:
-                logging.warning(f"Missing features: {missing_features}")
-                # Add missing features with zeros
-                for feature in missing_features:
-                    features[feature] = 0
-            
-            # Only keep the selected features in the right order
-            features = features[expected_features]
-        else:
+    else:
+        if verbose:
             logging.warning("Cannot determine expected feature order. Prediction may fail.")
-        
-        # Make predictions
-        try:
-            predictions = model.predict(features)
-            logging.info(f"Successfully made predictions on {len(predictions)} samples.")
-        except Exception as e:
-            logging.error(f"Error during prediction: {str(e)}")
-            raise
-        
-        # Prepare detection results
-        detection_results = []
-        for idx, row in df.iterrows():
-            result = {
-                "Index": int(idx),
-                "Threat": "Attack" if predictions[idx] == 1 else "Normal",
-                "Action": "Block" if predictions[idx] == 1 else "Allow"
-            }
-            
-            # Add timestamp, IPs and protocol if available
-            if 'timestamp' in df.columns:
-                result["Timestamp"] = str(row['timestamp'])
-            if 'src_ip' in df.columns:
-                result["Source IP"] = str(row['src_ip'])
-            if 'dst_ip' in df.columns:
-                result["Destination IP"] = str(row['dst_ip'])
-            if 'proto' in df.columns:
-                result["Protocol"] = str(row['proto'])
-                
-            detection_results.append(result)
-        
-        # Calculate metrics if we have the actual labels
-        if 'label' in df.columns:
-            y_true = df['label']
-            accuracy = accuracy_score(y_true, predictions)
-            precision = precision_score(y_true, predictions, zero_division=0)
-            recall = recall_score(y_true, predictions, zero_division=0)
-            f1 = f1_score(y_true, predictions, zero_division=0)
-            cm = confusion_matrix(y_true, predictions)
-            tn, fp, fn, tp = cm.ravel() if cm.size == 4 else (0, 0, 0, 0)
-            
-            metrics = {
-                "Total Packets Analyzed": int(len(df)),
-                "Intrusions Detected": int(predictions.sum()),
-                "Detection Accuracy": f"{accuracy * 100:.2f}%",
-                "False Positives": int(fp),
-                "False Negatives": int(fn),
-                "Precision": f"{precision * 100:.2f}%",
-                "Recall": f"{recall * 100:.2f}%",
-                "F1 Score": f"{f1 * 100:.2f}%"
-            }
+        return features
+
+    # Check for missing features
+    missing_features = [f for f in expected_features if f not in features.columns]
+    if missing_features:
+        if verbose:
+            logging.warning(f"Missing features: {missing_features}")
+        # Add missing features with zeros
+        features = features.assign(**{feature: 0 for feature in missing_features})
+
+    # Reorder features to match model's expected order
+    return features[expected_features]
+
+def confusion_counts(y_true, predictions):
+    """Return the binary confusion counts as an array ordered [tn, fp, fn, tp]."""
+    codes = np.asarray(y_true, dtype=np.int64) * 2 + np.asarray(predictions, dtype=np.int64)
+    return np.bincount(codes, minlength=4)[:4]
+
+def summarize_metrics(total, intrusions, counts=None):
+    """Build the DetectionMetrics section from running totals and confusion counts."""
+    metrics = {
+        "Total Packets Analyzed": int(total),
+        "Intrusions Detected": int(intrusions)
+    }
+    if counts is None:
+        return metrics
+
+    tn, fp, fn, tp = (int(count) for count in counts)
+    # Only labelled records are counted, which may be fewer than total (e.g. when streaming)
+    labelled = tn + fp + fn + tp
+    accuracy = (tp + tn) / labelled if labelled else 0.0
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0
+
+    metrics.update({
+        "Detection Accuracy": f"{accuracy * 100:.2f}%",
+        "False Positives": fp,
+        "False Negatives": fn,
+        "Precision": f"{precision * 100:.2f}%",
+        "Recall": f"{recall * 100:.2f}%",
+        "F1 Score": f"{f1 * 100:.2f}%"
+    })
+    return metrics
+
+def detect_intrusions(dataset_path, model_path, preview_size=10, export_format=None, chunksize=None,
+                      workers=1, artifacts_path=None, preprocess=False, frame=None,
+                      category_model_path=None, category_mode="cascade", export_path=None):
+    """
+    Run the model over a dataset and summarise the detections.
+
+    With chunksize set the CSV is streamed and scored chunk by chunk, so peak memory
+    is bounded by the chunk size; confusion counts and the preview are accumulated
+    across chunks and the resulting JSON is the same as for a full load.
+
+    workers > 1 shards the chunks across a process pool; for a full load (no chunksize)
+    it instead sets the model's native prediction thread count.
+
+    preprocess=True runs raw traffic through the pipeline fitted by prepro.py (found at
+    artifacts_path) before scoring, instead of zero-filling missing features.
+
+    frame scores an in-memory DataFrame instead of reading dataset_path, which then
+    only names the export file. export_path overrides that name.
+
+    category_model_path adds an attack category to every row (see load_category_model),
+    and per-class metrics with a confusion matrix when the data has attack_cat. In
+    "cascade" mode the category model only runs on rows the binary model flags; in
+    "multiclass" mode it replaces the binary model.
+    """
+    writer = None
+    threaded_model = None
+    try:
+        timings = StageTimings()
+        report_progress("detect", "load_model", 0.0)
+        workers = worker_count(workers)
+        preview_size = preview_count(preview_size)
+        if category_mode not in CATEGORY_MODES:
+            raise ValueError(f"Unsupported category mode: {category_mode}")
+        multiclass = category_model_path is not None and category_mode == "multiclass"
+
+        with timings.stage("load_model"):
+            model, preprocessing_artifacts = load_model(model_path, artifacts_path)
+            category_model, category_classes = (None, None)
+            if category_model_path:
+                category_model, category_classes = load_category_model(category_model_path)
+        if multiclass:
+            # Every row is scored by the category model, in this process
+            model = category_model
+            if workers > 1:
+                threaded_model = model
+                set_model_threads(model, workers)
+                workers = 1
+
+        # Load dataset
+        if frame is None:
+            logging.info(f"Loading dataset from {dataset_path}")
+            chunks = timings.iterate("load", read_dataset_chunks(dataset_path, chunksize))
         else:
-            metrics = {
-                "Total Packets Analyzed": int(len(df)),
-                "Intrusions Detected": int(predictions.sum())
-            }
+            chunks = frame_chunks(frame, chunksize)
+        if not chunksize and workers > 1:
+            threaded_model = model
+            set_model_threads(model, workers)
+            workers = 1
 
+        if export_format:
+            writer = DetectionResultWriter(dataset_path, export_format, export_path)
+
+        total = 0
+        intrusions = 0
+        counts = None
+        previews = []
+        preview_remaining = preview_size
+        category_confusion = None
+        category_counts = {}
+        if category_model is not None:
+            seen_classes = category_classes if category_classes is not None else getattr(category_model, "classes_", [])
+            category_confusion = CategoryConfusion([NORMAL_CATEGORY, *seen_classes])
+
+        for df, features, predictions in predict_chunks(chunks, model, preprocessing_artifacts, model_path,
+                                                        workers, preprocess, timings):
+            categories = None
+            if multiclass:
+                categories = decode_categories(predictions, category_classes)
+                predictions = (categories != NORMAL_CATEGORY).astype(np.int64)
+            elif category_model is not None:
+                with timings.stage("categorize", rows=int((predictions == 1).sum())):
+                    categories = predict_categories(category_model, category_classes, features, predictions)
+
+            total += len(df)
+            intrusions += int((predictions == 1).sum())
+
+            with timings.stage("results", rows=len(df)):
+                # Calculate metrics if we have the actual labels
+                if 'label' in df.columns:
+                    chunk_counts = confusion_counts(df['label'], predictions)
+                    counts = chunk_counts if counts is None else counts + chunk_counts
+
+                if categories is not None:
+                    for name, count in pd.Series(categories).value_counts().items():
+                        category_counts[name] = category_counts.get(name, 0) + int(count)
+                    if 'attack_cat' in df.columns:
+                        category_confusion.update(df['attack_cat'], categories)
+
+                # Prepare detection results (preview only; full results go to the export file)
+                if preview_remaining > 0:
+                    preview_rows = min(preview_remaining, len(df))
+                    previews.append(build_detection_results(
+                        df.iloc[:preview_rows], predictions[:preview_rows],
+                        None if categories is None else categories[:preview_rows]
+                    ))
+                    preview_remaining -= preview_rows
+
+                if writer:
+                    writer.write(build_detection_results(df, predictions, categories))
+
+            report_progress("detect", "predict", None if chunksize else 0.9, rows_processed=total)
+
+        logging.info(f"Successfully made predictions on {total} samples.")
+        report_progress("detect", "done", 1.0, rows_processed=total)
+
+        detection_results = pd.concat(previews, ignore_index=True) if previews else pd.DataFrame()
         result = {
-            "DetectionResults": detection_results[:10],  # First 10 results for preview
-            "TotalResults": len(detection_results),
-            "DetectionMetrics": metrics
+            "DetectionResults": detection_results.to_dict(orient="records"),
+            "TotalResults": int(total),
+            "DetectionMetrics": summarize_metrics(total, intrusions, counts),
+            # Pool workers are child processes, so their peak counts too
+            "memory": {"peak_rss_mb": peak_rss_mb(include_children=True)}
         }
-        
-        # Only output clean JSON to stdout
-        print(json.dumps(result, indent=2))
+        if category_model is not None:
+            result["CategoryCounts"] = category_counts
+            if category_confusion.counts.sum():
+                result["CategoryMetrics"] = category_confusion.summary()
+        if writer:
+            with timings.stage("results"):
+                writer.close()
+            logging.info(f"Exported detection results to {writer.path}")
+            result["ExportPath"] = writer.path
+        result["timings"] = timings.as_dict(include_children=True)
+        result["model_cache"] = registry.stats()
         return result
 
     except Exception as e:
         import traceback
-        error_result = {"error": str(e), "traceback": traceback.format_exc()}
-        # Output error as JSON to stdout
-        print(json.dumps(error_result, indent=2))
-        return error_result
+        if writer:
+            writer.close()
+        return {"error": str(e), "traceback": traceback.format_exc()}
+
+    finally:
+        # The model is shared through the registry; later requests start from the default
+        if threaded_model is not None:
+            set_model_threads(threaded_model, None)
+
+def serve(input_stream, output_stream):
+    """
+    Run as a long-lived worker speaking JSON lines.
+
+    Each request line is {"id": ..., "dataset_path": ..., "model_path": ...}, plus the
+    optional "preview_size", "export_format", "export_path", "chunksize", "workers", "artifacts_path",
+    "preprocess", "category_model_path" and "category_mode" keys, and is answered with
+    {"id": ..., "result": {...}} once the detection finishes. Models stay
+    loaded between requests and are reloaded when their files change (see model_registry).
+    {"command": "preload"} loads a model ahead of time, {"command": "stats"} returns the
+    model cache statistics and {"command": "shutdown"} ends the loop.
+    """
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            response = {"id": None, "result": {"error": f"Invalid request: {str(e)}"}}
+        else:
+            if request.get("command") == "shutdown":
+                break
+            set_progress_context(request_id=request.get("id"))
+            try:
+                result = handle_request(request)
+            except Exception as e:
+                # A malformed request (e.g. without dataset_path) is answered, not fatal
+                result = {"error": f"Invalid request: {type(e).__name__}: {str(e)}"}
+            response = {"id": request.get("id"), "result": result}
+
+        output_stream.write(json.dumps(response) + "\n")
+        output_stream.flush()
+
+def handle_request(request):
+    """Answer one serve() request other than shutdown."""
+    if request.get("command") == "stats":
+        return registry.stats()
+    if request.get("command") == "preload":
+        try:
+            load_model(request["model_path"], request.get("artifacts_path"))
+            return {"loaded": request["model_path"]}
+        except Exception as e:
+            return {"error": str(e)}
+    return detect_intrusions(
+        request["dataset_path"], request["model_path"],
+        preview_size=request.get("preview_size", 10),
+        export_format=request.get("export_format"),
+        export_path=request.get("export_path"),
+        chunksize=request.get("chunksize"),
+        workers=request.get("workers") or 1,
+        artifacts_path=request.get("artifacts_path"),
+        preprocess=request.get("preprocess", False),
+        category_model_path=request.get("category_model_path"),
+        category_mode=request.get("category_mode") or "cascade"
+    )
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
+    parser = argparse.ArgumentParser(description="Run intrusion detection on a dataset.")
+    parser.add_argument("dataset_path", nargs="?")
+    parser.add_argument("model_path", nargs="?")
+    parser.add_argument("--preview-size", type=int, default=10,
+                        help="Number of detection results to include in the JSON output")
+    parser.add_argument("--export", dest="export_format", choices=EXPORT_FORMATS,
+                        help="Also write the full detection results next to the dataset")
+    parser.add_argument("--chunksize", type=int,
+                        help="Stream the dataset in chunks of this many rows to bound memory use")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for chunked detection (threads for a full load)")
+    parser.add_argument("--artifacts", dest="artifacts_path",
+                        help="Fitted preprocessing pipeline from prepro.py "
+                             "(default: <model>_preprocessing_artifacts.pkl)")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Transform raw traffic with the fitted preprocessing pipeline before scoring")
+    parser.add_argument("--category-model", dest="category_model_path",
+                        help="Attack category model; adds a Category to each result and per-class metrics")
+    parser.add_argument("--category-mode", choices=CATEGORY_MODES, default="cascade",
+                        help="cascade: categorize only rows flagged as attacks; "
+                             "multiclass: score every row with the category model alone")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a persistent worker reading JSON-line requests from stdin")
+    args = parser.parse_args()
+
+    if args.serve:
+        # Keep stdout reserved for protocol messages; stray prints go to stderr
+        protocol_out = sys.stdout
+        sys.stdout = sys.stderr
+        serve(sys.stdin, protocol_out)
+        sys.exit(0)
+
+    if not args.dataset_path or not args.model_path:
         sys.stderr.write("Usage: python detection_script.py <dataset_path> <model_path>\n")
         sys.exit(1)
-        
-    dataset_path = sys.argv[1]
-    model_path = sys.argv[2]
-    
-    detect_intrusions(dataset_path, model_path)
\ No newline at end of file
+
+    result = detect_intrusions(args.dataset_path, args.model_path,
+                               preview_size=args.preview_size, export_format=args.export_format,
+                               chunksize=args.chunksize, workers=args.workers,
+                               artifacts_path=args.artifacts_path, preprocess=args.preprocess,
+                               category_model_path=args.category_model_path, category_mode=args.category_mode)
+
+    # Only output clean JSON to stdout
+    print(json.dumps(result, indent=2))
\ No newline at end of file
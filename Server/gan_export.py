@@ -0,0 +1,226 @@
+"""
+Compiled CPU inference graphs for the GAN generator and discriminator.
+
+The eager nn.Sequential modules are traced to TorchScript, frozen (weights become
+constants) and passed through torch.jit.optimize_for_inference, which fuses the
+Linear + activation pairs and picks the oneDNN kernels where available. With
+quantize=True the Linear layers are first converted to dynamic int8.
+
+Exported graphs are cached in GANModel/compiled, named after the kind, the SHA-256
+of the weights file and the precision, so retrained weights get a new graph and
+an unchanged file is only exported once. Each export is checked against the eager
+module on the same inputs; the result is stored next to the graph, and a graph
+whose error exceeds TOLERANCES is not used (the eager module is returned instead,
+with a warning). Discriminator graphs are checked on samples from the eager
+generator, since their scores choose which candidates select_top_samples keeps,
+and must also leave the top-scored half of those samples unchanged.
+
+With the current weights both int8 graphs fail their checks (generator Tanh
+outputs flip sign; the discriminator reorders about a third of the top half), so
+GAN_COMPILED=int8 runs the eager modules. The fp32 graphs match eager but are
+slower on single-core nodes (about 0.65-0.85x), so they are only exported here
+for parity testing and are not offered to the server.
+
+    python gan_export.py              # export float32 graphs and print the parity report
+    python gan_export.py --quantize   # the same for int8
+"""
+import os
+import sys
+import time
+import json
+import logging
+import argparse
+import warnings
+import contextlib
+import torch
+import torch.nn as nn
+from model_registry import registry, file_hash
+from GANBalancing import (
+    load_generator, load_discriminator, latent_dim, input_dim, GENERATOR_PATH, DISCRIMINATOR_PATH
+)
+
+COMPILED_DIR = os.path.join("GANModel", "compiled")
+
+# Largest differences from the eager outputs accepted for an exported graph
+TOLERANCES = {
+    "fp32": {"mean_abs_error": 1e-5, "max_abs_error": 1e-4},
+    "int8": {"mean_abs_error": 0.05, "max_abs_error": 0.1},
+}
+
+# Discriminator graphs also rank generated candidates: largest share of the eager
+# top-scored half that may drop out of the compiled graph's top half
+SELECTION_TOLERANCE = 0.01
+
+PARITY_SAMPLES = 4096
+
+# Eager loader and input width per module kind
+MODULES = {
+    "generator": (load_generator, latent_dim),
+    "discriminator": (load_discriminator, input_dim),
+}
+
+# torch.jit and torch.ao.quantization emit deprecation warnings on every call in recent
+# releases; they are kept out of the stage logs
+@contextlib.contextmanager
+def quiet_deprecations():
+    with warnings.catch_warnings():
+        for category in (FutureWarning, DeprecationWarning, UserWarning):
+            warnings.simplefilter("ignore", category)
+        yield
+
+# Export/parity report per loaded graph, keyed by (weights path, kind, quantize)
+reports = {}
+
+def export_module(module, input_size, quantize=False):
+    """Trace, freeze and optimize an eval-mode module for CPU inference."""
+    module = module.eval()
+    with quiet_deprecations(), torch.no_grad():
+        if quantize:
+            module = torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+        traced = torch.jit.trace(module, torch.randn(64, input_size))
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+def parity_check(eager, compiled, kind, samples=PARITY_SAMPLES, seed=0, generator_path=GENERATOR_PATH):
+    """
+    Mean, 99th percentile and max absolute difference between two modules on the same
+    inputs. Discriminators are fed samples of the eager generator at generator_path and
+    also report the share of the eager top-scored half that the compiled graph reorders
+    out of its own top half.
+    """
+    rng = torch.Generator().manual_seed(seed)
+    noise = torch.randn(samples, latent_dim, generator=rng)
+    with torch.inference_mode():
+        inputs = noise if kind == "generator" else load_generator(generator_path)(noise)
+        expected, actual = eager(inputs), compiled(inputs)
+        difference = (expected - actual).abs().flatten()
+    report = {
+        "mean_abs_error": float(difference.mean()),
+        "p99_abs_error": float(torch.quantile(difference, 0.99)),
+        "max_abs_error": float(difference.max())
+    }
+    if kind == "discriminator":
+        half = samples // 2
+        top_expected = set(torch.topk(expected.flatten(), half).indices.tolist())
+        top_actual = set(torch.topk(actual.flatten(), half).indices.tolist())
+        report["top_half_changed"] = 1 - len(top_expected & top_actual) / half
+    return report
+
+def compiled_path(weights_path, kind, quantize=False, weights_hash=None):
+    """Cache location of the exported graph for a weights file."""
+    weights_hash = weights_hash or file_hash(weights_path)
+    precision = "int8" if quantize else "fp32"
+    return os.path.join(COMPILED_DIR, f"{kind}_{weights_hash[:16]}_{precision}.pt")
+
+def load_compiled(weights_path, kind, quantize=False, tolerances=None, generator_path=GENERATOR_PATH):
+    """
+    Return the compiled graph for weights_path, exporting and checking it on first use.
+    Falls back to the eager module when the graph failed its parity check.
+    generator_path provides the samples a discriminator is checked on.
+    """
+    load_eager, input_size = MODULES[kind]
+    tolerances = tolerances or TOLERANCES["int8" if quantize else "fp32"]
+    if kind == "discriminator":
+        tolerances = {**tolerances, "top_half_changed": SELECTION_TOLERANCE}
+    # A discriminator's check depends on the generator it was checked against
+    inputs_hash = file_hash(generator_path) if kind == "discriminator" else None
+    graph_path = compiled_path(weights_path, kind, quantize)
+    report_path = os.path.splitext(graph_path)[0] + ".json"
+
+    report = None
+    if os.path.exists(graph_path) and os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+        report["cache"] = "hit"
+        if any(measure not in report["parity"] for measure in tolerances) or \
+                report.get("parity_inputs") != inputs_hash:
+            # Checked before this measure existed, or on another generator; export and check again
+            report = None
+    if report is None:
+        eager = load_eager(weights_path)
+        compiled = export_module(load_eager(weights_path), input_size, quantize)
+        report = {
+            "kind": kind,
+            "precision": "int8" if quantize else "fp32",
+            "weights": os.path.basename(weights_path),
+            "parity": parity_check(eager, compiled, kind, generator_path=generator_path),
+            "parity_inputs": inputs_hash,
+            "torch": torch.__version__
+        }
+        os.makedirs(COMPILED_DIR, exist_ok=True)
+        # Written to a temporary name first so a concurrent reader never sees half a file
+        with quiet_deprecations():
+            torch.jit.save(compiled, graph_path + ".tmp")
+        os.replace(graph_path + ".tmp", graph_path)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=4)
+        report["cache"] = "exported"
+        logging.info(f"Exported {kind} graph to {graph_path}")
+
+    failed = {
+        measure: report["parity"][measure]
+        for measure, limit in tolerances.items() if report["parity"][measure] > limit
+    }
+    report["path"] = graph_path
+    report["tolerances"] = tolerances
+    report["passed"] = not failed
+    reports[(os.path.abspath(weights_path), kind, quantize)] = report
+
+    if failed:
+        exceeded = ", ".join(f"{measure} {value:.4g} > {tolerances[measure]}" for measure, value in failed.items())
+        logging.warning(f"{kind} graph differs from the eager module ({exceeded}); using the eager module")
+        return load_eager(weights_path)
+    with quiet_deprecations():
+        return torch.jit.load(graph_path)
+
+def load_compiled_models(generator_path, discriminator_path, quantize=False):
+    """Compiled counterpart of GANBalancing.load_models, cached in the shared model registry."""
+    suffix = "int8" if quantize else "fp32"
+    generator = registry.load(generator_path, lambda path: load_compiled(path, "generator", quantize),
+                              kind=f"generator-{suffix}")
+    discriminator = registry.load(
+        discriminator_path, lambda path: load_compiled(path, "discriminator", quantize, generator_path=generator_path),
+        kind=f"discriminator-{suffix}"
+    )
+    return generator, discriminator
+
+def export_report(generator_path, discriminator_path, quantize=False):
+    """Reports of the graphs loaded for the given weights (cache status, parity, path)."""
+    return {
+        kind: reports.get((os.path.abspath(path), kind, quantize))
+        for kind, path in (("generator", generator_path), ("discriminator", discriminator_path))
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    parser = argparse.ArgumentParser(description="Export the GAN modules to optimized TorchScript graphs.")
+    parser.add_argument("--generator", default=GENERATOR_PATH)
+    parser.add_argument("--discriminator", default=DISCRIMINATOR_PATH)
+    parser.add_argument("--quantize", action="store_true", help="Export dynamic int8 graphs")
+    parser.add_argument("--batch-size", type=int, default=8192, help="Batch size of the throughput check")
+    parser.add_argument("--repeat", type=int, default=10, help="Batches timed per variant")
+    args = parser.parse_args()
+
+    generator, discriminator = load_compiled_models(args.generator, args.discriminator, args.quantize)
+    eager_generator, eager_discriminator = load_generator(args.generator), load_discriminator(args.discriminator)
+
+    def samples_per_second(generator, discriminator):
+        noise = torch.randn(args.batch_size, latent_dim)
+        with torch.inference_mode():
+            discriminator(generator(noise))
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                discriminator(generator(noise))
+        return round(args.batch_size * args.repeat / (time.perf_counter() - start), 1)
+
+    eager_rate = samples_per_second(eager_generator, eager_discriminator)
+    compiled_rate = samples_per_second(generator, discriminator)
+    print(json.dumps({
+        "graphs": export_report(args.generator, args.discriminator, args.quantize),
+        "throughput": {
+            "threads": torch.get_num_threads(),
+            "eager_samples_per_sec": eager_rate,
+            "compiled_samples_per_sec": compiled_rate,
+            "speedup": round(compiled_rate / eager_rate, 2)
+        }
+    }, indent=4))
@@ -0,0 +1,121 @@
+"""
+Quality metrics for GAN-generated samples.
+
+Everything works on float32 matrices: the discriminator runs batch by batch under
+torch.inference_mode(), and feature means/stds are accumulated in the same pass.
+MMD is estimated on a random sample of rows so its cost does not grow with the dataset.
+"""
+import numpy as np
+import torch
+
+DEFAULT_BATCH_SIZE = 8192
+DEFAULT_MMD_SAMPLE_SIZE = 2000
+
+def paired_cosine_similarity(real, synthetic):
+    """Mean cosine similarity between row i of real and row i of synthetic."""
+    n = min(len(real), len(synthetic))
+    if n == 0:
+        return None
+    real, synthetic = real[:n], synthetic[:n]
+
+    dots = np.einsum("ij,ij->i", real, synthetic)
+    norms = np.linalg.norm(real, axis=1) * np.linalg.norm(synthetic, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(np.mean(dots / norms))
+
+def score_and_moments(discriminator, data, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Run the discriminator over data in batches and accumulate per-feature moments.
+
+    Returns (scores, mean, std) where std is the population standard deviation.
+    """
+    scores = np.empty(len(data), dtype=np.float32)
+    feature_sum = np.zeros(data.shape[1], dtype=np.float64)
+    feature_sq_sum = np.zeros(data.shape[1], dtype=np.float64)
+
+    with torch.inference_mode():
+        for start in range(0, len(data), batch_size):
+            batch = data[start:start + batch_size]
+            scores[start:start + len(batch)] = discriminator(torch.from_numpy(batch)).numpy().ravel()
+            feature_sum += batch.sum(axis=0, dtype=np.float64)
+            feature_sq_sum += np.square(batch, dtype=np.float64).sum(axis=0)
+
+    count = max(len(data), 1)
+    mean = feature_sum / count
+    std = np.sqrt(np.maximum(feature_sq_sum / count - np.square(mean), 0.0))
+    return scores, mean, std
+
+def mmd_rbf(real, synthetic, sample_size=DEFAULT_MMD_SAMPLE_SIZE, seed=0):
+    """
+    Biased estimate of the squared maximum mean discrepancy with an RBF kernel,
+    on up to sample_size rows from each side. The bandwidth is the median squared
+    pairwise distance of the pooled sample.
+    """
+    rng = np.random.default_rng(seed)
+    if len(real) > sample_size:
+        real = real[rng.choice(len(real), sample_size, replace=False)]
+    if len(synthetic) > sample_size:
+        synthetic = synthetic[rng.choice(len(synthetic), sample_size, replace=False)]
+    if len(real) == 0 or len(synthetic) == 0:
+        return None
+
+    x = torch.from_numpy(real)
+    y = torch.from_numpy(synthetic)
+    d_xx = torch.cdist(x, x).square()
+    d_yy = torch.cdist(y, y).square()
+    d_xy = torch.cdist(x, y).square()
+
+    pooled = torch.cat([d_xx.flatten(), d_yy.flatten(), d_xy.flatten()])
+    bandwidth = pooled[pooled > 0].median() if (pooled > 0).any() else torch.tensor(1.0)
+
+    k_xx = torch.exp(-d_xx / bandwidth).mean()
+    k_yy = torch.exp(-d_yy / bandwidth).mean()
+    k_xy = torch.exp(-d_xy / bandwidth).mean()
+    return float(k_xx + k_yy - 2 * k_xy)
+
+def evaluate_synthetic_data(discriminator, real, synthetic, feature_names=None,
+                            batch_size=DEFAULT_BATCH_SIZE, mmd_sample_size=DEFAULT_MMD_SAMPLE_SIZE):
+    """
+    Compare real and synthetic samples (both already scaled to the generator's range).
+    Metrics that need rows from both sides are None when either side is empty.
+
+    cosine_similarity and discriminator_score keep their original meaning: row-paired
+    cosine similarity and the mean of real minus synthetic discriminator scores over
+    the paired rows. The drift metrics compare per-feature means and stds.
+    """
+    real = np.ascontiguousarray(real, dtype=np.float32)
+    synthetic = np.ascontiguousarray(synthetic, dtype=np.float32)
+
+    real_scores, real_mean, real_std = score_and_moments(discriminator, real, batch_size)
+    synthetic_scores, synthetic_mean, synthetic_std = score_and_moments(discriminator, synthetic, batch_size)
+
+    # Average discriminator score difference over the paired rows
+    min_length = min(len(real_scores), len(synthetic_scores))
+    discriminator_score = (
+        float(np.mean(real_scores[:min_length] - synthetic_scores[:min_length])) if min_length else None
+    )
+
+    if feature_names is None:
+        feature_names = [str(i) for i in range(real.shape[1])]
+    if len(real) and len(synthetic):
+        mean_drift = synthetic_mean - real_mean
+        std_drift = synthetic_std - real_std
+        drift = {
+            "mean_abs_mean_drift": float(np.abs(mean_drift).mean()),
+            "mean_abs_std_drift": float(np.abs(std_drift).mean()),
+            "feature_drift": {
+                name: {"mean_drift": float(m), "std_drift": float(s)}
+                for name, m, s in zip(feature_names, mean_drift, std_drift)
+            }
+        }
+    else:
+        drift = {"mean_abs_mean_drift": None, "mean_abs_std_drift": None, "feature_drift": {}}
+
+    return {
+        "cosine_similarity": paired_cosine_similarity(real, synthetic),
+        "discriminator_score": discriminator_score,
+        "mean_discriminator_score_real": float(real_scores.mean()) if len(real_scores) else None,
+        "mean_discriminator_score_synthetic": float(synthetic_scores.mean()) if len(synthetic_scores) else None,
+        "mmd": mmd_rbf(real, synthetic, mmd_sample_size),
+        **drift
+    }
@@ -0,0 +1,117 @@
+"""
+Process-wide cache of loaded models and fitted artifacts.
+
+Each file is loaded once and kept until it changes on disk or is evicted. A cached
+entry is revalidated on every lookup with a stat() call: the same size and mtime
+mean a hit. When they differ and hashing is enabled, the content hash decides,
+so a file that was only touched or copied back unchanged is not reloaded. A
+retrained model written to the same path is picked up on the next lookup without
+restarting the worker, and different versions stored at different paths are
+cached side by side.
+
+Least recently used entries are evicted beyond MODEL_CACHE_SIZE (env var, default 8).
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("MODEL_CACHE_SIZE", 8))
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ModelRegistry:
+    """LRU cache of objects loaded from files, validated by size/mtime and optionally hash."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, use_hash=True):
+        self.max_entries = max_entries
+        self.use_hash = use_hash
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def load(self, path, loader, kind=None):
+        """
+        Return loader(path), loading it only if the file is not cached or has changed.
+        kind separates different loaders for the same file (e.g. "generator").
+        Raises FileNotFoundError like the loader would if the file does not exist.
+        """
+        key = (os.path.abspath(path), kind)
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["signature"] != signature and self.use_hash and entry["hash"] == file_hash(path):
+                    entry["signature"] = signature
+                if entry["signature"] == signature:
+                    self._entries.move_to_end(key)
+                    entry["hits"] += 1
+                    self.hits += 1
+                    return entry["value"]
+                self.reloads += 1
+                logging.info(f"{path} changed on disk; reloading")
+
+            self.misses += 1
+            start = time.perf_counter()
+            value = loader(path)
+            elapsed = time.perf_counter() - start
+            self.load_seconds += elapsed
+
+            self._entries[key] = {
+                "value": value,
+                "signature": signature,
+                "hash": file_hash(path) if self.use_hash else None,
+                "load_seconds": elapsed,
+                "loaded_at": time.time(),
+                "hits": 0
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                logging.info(f"Evicted {evicted[0]} from the model cache")
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit rate, load time and the currently cached files (most recently used last)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "load_seconds": round(self.load_seconds, 4),
+                "entries": [
+                    {
+                        "path": path,
+                        "kind": kind,
+                        "sha256": entry["hash"],
+                        "load_seconds": round(entry["load_seconds"], 4),
+                        "hits": entry["hits"]
+                    }
+                    for (path, kind), entry in self._entries.items()
+                ]
+            }
+
+# Shared by every stage running in this process
+registry = ModelRegistry()
@@ -0,0 +1,136 @@
+"""
+Runs preprocess -> balance -> detect in one process.
+
+The dataset is read once and handed between the stages as DataFrames, so the run
+saves two interpreter start-ups and the write/read cycle of each intermediate
+file. Writing the preprocessed and balanced datasets is optional. The output keeps
+every stage's usual JSON summary under "preprocess", "balance" and "detect".
+"""
+import json
+import argparse
+import joblib
+from data_io import read_table, write_table
+from progress import report_progress
+from profiling import peak_rss_mb, StageTimings
+from model_registry import registry
+from prepro import fit_preprocessing, default_artifacts_path
+from GANBalancing import (
+    load_models, balance_dataset, GENERATOR_PATH, DISCRIMINATOR_PATH,
+    DEFAULT_BATCH_SIZE, DEFAULT_OVERSAMPLE_RATIO, DEFAULT_MMD_SAMPLE_SIZE
+)
+from detection_script import detect_intrusions, CATEGORY_MODES
+
+DEFAULT_MODEL_PATH = "binary_xgboost_model/binary_xgboost_model.pkl"
+
+def run_pipeline(dataset_path, options, model_path=DEFAULT_MODEL_PATH, preprocessed_path=None,
+                 balanced_path=None, artifacts_path=None, preview_size=10, export_format=None,
+                 chunksize=None, workers=1, batch_size=DEFAULT_BATCH_SIZE,
+                 oversample_ratio=DEFAULT_OVERSAMPLE_RATIO, mmd_sample_size=DEFAULT_MMD_SAMPLE_SIZE,
+                 compiled=None, category_model_path=None, category_mode="cascade"):
+    """
+    Preprocess, balance and score dataset_path in memory.
+
+    options are the prepro.py options (missingValueHandling, featureScaling, ...).
+    preprocessed_path and balanced_path, when given, also write the intermediate
+    datasets; the fitted preprocessing pipeline is saved when artifacts_path or
+    preprocessed_path is set. compiled="int8" runs the GAN from its
+    exported, quantized TorchScript graphs. category_model_path and category_mode add attack
+    categories to the detections (see detection_script.detect_intrusions).
+    """
+    try:
+        timings = StageTimings()
+
+        report_progress("preprocess", "load", 0.0)
+        with timings.stage("load"):
+            df = read_table(dataset_path, optimize=True)
+        timings.add_rows("load", len(df))
+
+        # Preprocess
+        preprocess_timings = StageTimings()
+        with timings.stage("preprocess", rows=len(df)):
+            df, artifacts, preprocess_summary = fit_preprocessing(df, **options, timings=preprocess_timings)
+            if preprocessed_path:
+                with preprocess_timings.stage("write", rows=len(df)):
+                    write_table(df, preprocessed_path)
+            artifacts_path = artifacts_path or (default_artifacts_path(preprocessed_path) if preprocessed_path else None)
+            if artifacts_path:
+                joblib.dump(artifacts, artifacts_path)
+        report_progress("preprocess", "done", 1.0)
+        preprocess_summary.update({
+            "preprocessedFilePath": preprocessed_path,
+            "artifactsPath": artifacts_path,
+            "timings": preprocess_timings.as_dict()
+        })
+
+        # Balance
+        balance_timings = StageTimings()
+        report_progress("balance", "load", 0.0)
+        with timings.stage("balance", rows=len(df)):
+            with balance_timings.stage("load_model"):
+                generator, discriminator = load_models(GENERATOR_PATH, DISCRIMINATOR_PATH, compiled=compiled)
+                metrics_discriminator = load_models(GENERATOR_PATH, DISCRIMINATOR_PATH)[1] if compiled else None
+            df, balance_summary = balance_dataset(
+                generator, discriminator, df, batch_size=batch_size, oversample_ratio=oversample_ratio,
+                mmd_sample_size=mmd_sample_size, timings=balance_timings, metrics_discriminator=metrics_discriminator
+            )
+            if balanced_path:
+                report_progress("balance", "write", 0.95)
+                with balance_timings.stage("write", rows=len(df)):
+                    write_table(df, balanced_path)
+        report_progress("balance", "done", 1.0)
+        balance_summary["balancedFilePath"] = balanced_path
+        balance_summary["timings"] = balance_timings.as_dict()
+
+        # Detect (export files are named after the balanced dataset, or the input if none is written)
+        with timings.stage("detect", rows=len(df)):
+            detect_summary = detect_intrusions(
+                balanced_path or dataset_path, model_path, preview_size=preview_size,
+                export_format=export_format, chunksize=chunksize, workers=workers, frame=df,
+                artifacts_path=artifacts_path,
+                category_model_path=category_model_path, category_mode=category_mode
+            )
+        if "error" in detect_summary:
+            return {"error": detect_summary["error"], "stage": "detect", "details": detect_summary}
+
+        return {
+            "preprocess": preprocess_summary,
+            "balance": balance_summary,
+            "detect": detect_summary,
+            "memory": {"peak_rss_mb": peak_rss_mb(include_children=True)},
+            "timings": timings.as_dict(include_children=True),
+            "model_cache": registry.stats()
+        }
+
+    except Exception as e:
+        import traceback
+        return {"error": str(e), "traceback": traceback.format_exc()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess, balance and score a dataset in one process.")
+    parser.add_argument("dataset_path")
+    parser.add_argument("options", help="JSON preprocessing options, as for prepro.py")
+    parser.add_argument("--model", dest="model_path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--preprocessed-output", help="Also write the preprocessed dataset here")
+    parser.add_argument("--balanced-output", help="Also write the balanced dataset here")
+    parser.add_argument("--artifacts", help="Save the fitted preprocessing pipeline here")
+    parser.add_argument("--preview-size", type=int, default=10)
+    parser.add_argument("--export", dest="export_format", choices=["csv", "parquet"])
+    parser.add_argument("--chunksize", type=int)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--oversample-ratio", type=float, default=DEFAULT_OVERSAMPLE_RATIO)
+    parser.add_argument("--mmd-sample-size", type=int, default=DEFAULT_MMD_SAMPLE_SIZE)
+    parser.add_argument("--category-model", dest="category_model_path", help="Attack category model for detection")
+    parser.add_argument("--category-mode", choices=CATEGORY_MODES, default="cascade")
+    parser.add_argument("--compiled", choices=["int8"], help="Run the GAN from its exported int8 TorchScript graphs")
+    args = parser.parse_args()
+
+    result = run_pipeline(
+        args.dataset_path, json.loads(args.options), model_path=args.model_path,
+        preprocessed_path=args.preprocessed_output, balanced_path=args.balanced_output,
+        artifacts_path=args.artifacts, preview_size=args.preview_size, export_format=args.export_format,
+        chunksize=args.chunksize, workers=args.workers, batch_size=args.batch_size,
+        oversample_ratio=args.oversample_ratio, mmd_sample_size=args.mmd_sample_size,
+        compiled=args.compiled, category_model_path=args.category_model_path, category_mode=args.category_mode
+    )
+    print(json.dumps(result))
@@ -1,134 +1,389 @@
 import sys
+import os
 import json
+import argparse
+import logging
+import joblib
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.feature_selection import SelectKBest, chi2
 from sklearn.impute import SimpleImputer
+from data_io import read_table, write_table
+from progress import report_progress
+from profiling import peak_rss_mb, StageTimings
 
-def preprocess_dataset(
-    missingValueHandling, featureScaling, encodingCategorical, featureSelection, dataset_path, output_path
+# Diagnostics go to stderr; stdout carries only the JSON result
+logging.basicConfig(stream=sys.stderr, level=logging.INFO,
+                    format='[%(levelname)s] %(message)s')
+
+def replace_infinite(df):
+    """Replace infinite values in df's floating point columns with NaN, in place."""
+    # Column by column, and only where needed, so no copy of the whole frame is made
+    for col in df.select_dtypes(include=["floating"]).columns:
+        if np.isinf(df[col].to_numpy()).any():
+            df[col] = df[col].replace([np.inf, -np.inf], np.nan)
+
+def default_artifacts_path(output_path):
+    """Place the fitted pipeline next to the preprocessed dataset."""
+    return f"{os.path.splitext(output_path)[0]}_preprocessing_artifacts.pkl"
+
+# Rows per block when accumulating chi2 statistics
+CHI2_CHUNKSIZE = 500_000
+
+# Rows per block when fitting the feature scaler
+SCALE_CHUNKSIZE = 100_000
+
+def chi2_scores(X, y, chunksize=CHI2_CHUNKSIZE):
+    """
+    chi2 statistic of every column of the non-negative matrix X against the labels y.
+
+    Same statistic as sklearn's chi2, but the class-by-feature observed sums are
+    accumulated block by block in float64 straight from X, so no one-hot matrix or
+    float64 copy of X is built.
+    """
+    classes, codes = np.unique(np.asarray(y), return_inverse=True)
+    observed = np.zeros((len(classes), X.shape[1]), dtype=np.float64)
+
+    for start in range(0, X.shape[0], chunksize):
+        block = X[start:start + chunksize]
+        block_codes = codes[start:start + chunksize]
+        for code in range(len(classes)):
+            observed[code] += block[block_codes == code].sum(axis=0, dtype=np.float64)
+
+    feature_count = observed.sum(axis=0)
+    class_prob = np.bincount(codes, minlength=len(classes)) / len(codes)
+    expected = np.outer(class_prob, feature_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ((observed - expected) ** 2 / expected).sum(axis=0)
+
+def stratified_sample_indices(y, sample_size, random_state=0):
+    """Row indices of a sample of about sample_size rows keeping each class's share."""
+    y = np.asarray(y)
+    if sample_size is None or len(y) <= sample_size:
+        return None
+
+    rng = np.random.default_rng(random_state)
+    classes, codes, counts = np.unique(y, return_inverse=True, return_counts=True)
+    fraction = sample_size / len(y)
+    indices = [
+        rng.choice(np.flatnonzero(codes == code), max(1, int(round(count * fraction))), replace=False)
+        for code, count in enumerate(counts)
+    ]
+    return np.sort(np.concatenate(indices))
+
+def select_k_best_chi2(X, y, k, sample_size=None):
+    """
+    Pick the k highest-scoring columns of X by chi2, in column order (as SelectKBest does).
+    Scores come from a stratified sample of sample_size rows when given.
+    Returns (selected column indices, scores for all columns).
+    """
+    sample = stratified_sample_indices(y, sample_size)
+    if sample is not None:
+        X, y = X[sample], np.asarray(y)[sample]
+
+    scores = chi2_scores(X, y)
+    k = min(k, len(scores))
+    ranked = np.argsort(np.where(np.isnan(scores), -np.inf, scores), kind="mergesort")
+    return np.sort(ranked[len(scores) - k:]), scores
+
+def fit_preprocessing(
+    df, missingValueHandling, featureScaling, encodingCategorical, featureSelection,
+    featureSelectionK=42, featureSelectionSampleSize=None, timings=None
 ):
-    try:
-        # Load the dataset
-        df = pd.read_csv(dataset_path)
+    """
+    Fit the preprocessing pipeline on an in-memory frame and transform it.
+
+    Returns (preprocessed frame, fitted artifacts for apply_preprocessing, summary dict).
+    df is consumed: its columns are dropped in place as they are replaced, so the
+    caller's reference does not keep them alive. preprocess_dataset wraps this with
+    reading and writing the files.
+    """
+    timings = timings or StageTimings()
+
+    # Standardize column names by stripping and converting to lowercase
+    df.columns = df.columns.str.strip().str.lower()
+    logging.info(f"Columns in Dataset: {list(df.columns)}")
 
-        # Standardize column names by stripping and converting to lowercase
-        df.columns = df.columns.str.strip().str.lower()
-        print(f"Columns in Dataset: {list(df.columns)}")  # Debugging: Show column names
+    # Replace infinite values with NaN
+    replace_infinite(df)
 
-        # Replace infinite values with NaN
-        df.replace([float('inf'), float('-inf')], float('nan'), inplace=True)
+    # Drop the 'id' column if it exists
+    if 'id' in df.columns:
+        df.drop(columns=['id'], inplace=True)
+        logging.info("Removed 'id' column.")
 
-        # Drop the 'id' column if it exists
-        if 'id' in df.columns:
-            df = df.drop(columns=['id'])
-            print("Removed 'id' column.")
+    # Separate target labels if present
+    target_columns = [col for col in df.columns if col in ['attack_cat', 'label']]
+    logging.info(f"Identified Target Columns: {target_columns}")
 
-        # Separate target labels if present
-        target_columns = [col for col in df.columns if col in ['attack_cat', 'label']]
-        print(f"Identified Target Columns: {target_columns}")  # Debugging
+    targets = df[target_columns] if target_columns else None
+    df.drop(columns=target_columns, inplace=True)
 
-        targets = df[target_columns] if target_columns else None
-        df = df.drop(columns=target_columns, errors='ignore')
+    # Identify numeric and non-numeric columns
+    numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+    non_numeric_cols = df.select_dtypes(exclude=["number"]).columns.tolist()
+    logging.info(f"Numeric Columns: {numeric_cols}")
+    logging.info(f"Non-Numeric Columns: {non_numeric_cols}")
 
-        # Identify numeric and non-numeric columns
-        numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
-        non_numeric_cols = df.select_dtypes(exclude=["number"]).columns.tolist()
-        print(f"Numeric Columns: {numeric_cols}")
-        print(f"Non-Numeric Columns: {non_numeric_cols}")
+    # Everything fitted below is collected here so new traffic can be transformed
+    # later without refitting (see apply_preprocessing)
+    artifacts = {
+        "numeric_cols": numeric_cols,
+        "non_numeric_cols": non_numeric_cols,
+        "numeric_imputer": None,
+        "categorical_imputer": None,
+        "label_encoders": {},
+        "feature_shift": {},
+        "selected_features": [],
+        "scaler": None
+    }
 
-        # Original missing values
-        original_missing_values = df.isna().sum()
+    # Original missing values
+    original_missing_values = df.isna().sum()
 
-        # Handle missing values
+    # Handle missing values
+    report_progress("preprocess", "impute", 0.2, rows=len(df))
+    with timings.stage("impute", rows=len(df)):
         if missingValueHandling:
             if numeric_cols:
-                imputer = SimpleImputer(strategy="mean")
-                df[numeric_cols] = imputer.fit_transform(df[numeric_cols])
+                # Fitted on a single float32 copy of the numeric columns, then only the
+                # columns with missing values are filled, so their dtypes are kept and no
+                # float64 frame is built
+                imputer = SimpleImputer(strategy="mean", copy=False)
+                imputer.fit(pd.DataFrame(df[numeric_cols].to_numpy(dtype=np.float32), columns=numeric_cols, copy=False))
+                imputer.set_params(copy=True)
+                for col, value in zip(numeric_cols, imputer.statistics_):
+                    if df[col].isna().any():
+                        df[col] = df[col].fillna(df[col].dtype.type(value))
+                artifacts["numeric_imputer"] = imputer
 
             if non_numeric_cols:
                 imputer = SimpleImputer(strategy="most_frequent")
                 df[non_numeric_cols] = imputer.fit_transform(df[non_numeric_cols])
+                artifacts["categorical_imputer"] = imputer
 
-        # Missing values after preprocessing
-        missing_values_after = df.isna().sum()
+    # Missing values after preprocessing
+    missing_values_after = df.isna().sum()
 
-        # Encode categorical variables with Label Encoding
-        encoding_summary = {}
+    # Encode categorical variables with Label Encoding
+    report_progress("preprocess", "encode", 0.35)
+    encoding_summary = {}
+    with timings.stage("encode", rows=len(df)):
         if encodingCategorical and non_numeric_cols:
-            label_encoders = {}
             for col in non_numeric_cols:
                 le = LabelEncoder()
                 df[col] = le.fit_transform(df[col])
-                label_encoders[col] = dict(zip(le.classes_, le.transform(le.classes_)))
+                artifacts["label_encoders"][col] = le.classes_
                 encoding_summary[col] = f"Encoded {len(le.classes_)} unique values"
 
-        # Feature selection using SelectKBest with chi2 (including all columns)
-        feature_selection_summary = {}
-        selected_features = []
+    # Feature selection using SelectKBest with chi2 (including all columns)
+    report_progress("preprocess", "select", 0.5)
+    feature_selection_summary = {}
+    selected_features = []
+    with timings.stage("select", rows=len(df)):
         if featureSelection and targets is not None:
-            # Ensure all columns are non-negative for chi2
+            # Ensure all columns are non-negative for chi2 (one vectorized shift of the negative columns)
             all_cols = numeric_cols + non_numeric_cols  # Include all columns
-            df[all_cols] = df[all_cols].apply(lambda x: x - x.min() if x.min() < 0 else x)
+            column_min = df[all_cols].min()
+            shift = column_min[column_min < 0]
+            artifacts["feature_shift"] = shift.to_dict()
+            if not shift.empty:
+                df[shift.index] = df[shift.index] - shift
 
             target = targets[target_columns[0]]  # Assuming the first target column is used
-            selector = SelectKBest(score_func=chi2, k=42)  # Select top 42 features
 
-            # Apply feature selection
-            selector.fit(df[all_cols], target)
+            # Score every feature on a float32 matrix and select the top k
+            features_matrix = df[all_cols].to_numpy(dtype=np.float32)
+            selected_indices, scores = select_k_best_chi2(
+                features_matrix, target.to_numpy(), featureSelectionK, featureSelectionSampleSize
+            )
+            del features_matrix
 
-            selected_features = [all_cols[i] for i in selector.get_support(indices=True)]
+            selected_features = [all_cols[i] for i in selected_indices]
             feature_selection_summary = {
-                feature: score for feature, score in zip(selected_features, selector.scores_)
+                feature: (None if np.isnan(score) else float(score)) for feature, score in zip(all_cols, scores)
             }
 
-            # Retain only the selected features
-            df = df[selected_features]
+            # Retain only the selected features (in place, so the other columns are freed
+            # even while the caller still holds the frame)
+            df.drop(columns=df.columns.difference(selected_features), inplace=True)
+            artifacts["selected_features"] = selected_features
 
-        # Feature scaling for selected features (last step)
-        scaling_summary = {}
+    # Feature scaling for selected features (last step)
+    report_progress("preprocess", "scale", 0.7)
+    scaling_summary = {}
+    with timings.stage("scale", rows=len(df)):
         if featureScaling and selected_features:
-            scaler = StandardScaler()
-            df_scaled = scaler.fit_transform(df[selected_features])
-            scaled_data = pd.DataFrame(df_scaled, columns=selected_features)
+            # One float32 matrix, scaled in place: the scaler is fitted block by block so
+            # its variance pass never holds a temporary the size of the matrix
+            matrix = df[selected_features].to_numpy(dtype=np.float32, copy=True)
+            df.drop(columns=selected_features, inplace=True)
+            scaler = StandardScaler(copy=False)
+            for start in range(0, len(matrix), SCALE_CHUNKSIZE):
+                scaler.partial_fit(matrix[start:start + SCALE_CHUNKSIZE])
+            scaler.transform(matrix)
+            artifacts["scaler"] = scaler
 
-            # Output only the scaled mean and scaled std for each selected feature
-            for col in selected_features:
+            # Output only the scaled mean and scaled std for each selected feature, one
+            # column at a time (accumulated in float64, returned as Python floats for json)
+            for i, col in enumerate(selected_features):
+                scaled_column = matrix[:, i]
                 scaling_summary[col] = {
-                    "Scaled Mean": scaled_data[col].mean(),  # Only output the scaled mean
-                    "Scaled Std": scaled_data[col].std()     # Only output the scaled std
+                    "Scaled Mean": float(scaled_column.mean(dtype=np.float64)),  # Only output the scaled mean
+                    "Scaled Std": float(scaled_column.std(dtype=np.float64, ddof=1))  # Only output the scaled std
                 }
-            df = scaled_data
+            df = pd.DataFrame(matrix, columns=selected_features, copy=False)
+        elif selected_features:
+            df = df[selected_features]
+
+    # Concatenate targets back to the processed dataset
+    if targets is not None:
+        df = pd.concat([df, targets.reset_index(drop=True)], axis=1)
+
+    summary = {
+        "missingValueSummary": {
+            "Original Missing Values": original_missing_values.to_dict(),
+            "After Preprocessing": missing_values_after.to_dict()
+        },
+        "featureScalingSummary": scaling_summary,
+        "encodingSummary": encoding_summary,
+        "featureSelectionSummary": feature_selection_summary,
+        "selectedFeatures": selected_features
+    }
+    return df, artifacts, summary
+
+def preprocess_dataset(
+    missingValueHandling, featureScaling, encodingCategorical, featureSelection, dataset_path, output_path,
+    artifacts_path=None, featureSelectionK=42, featureSelectionSampleSize=None
+):
+    try:
+        # Load the dataset
+        timings = StageTimings()
+        report_progress("preprocess", "load", 0.0)
+        with timings.stage("load"):
+            df = read_table(dataset_path, optimize=True)
+        timings.add_rows("load", len(df))
 
-        # Concatenate targets back to the processed dataset
-        if targets is not None:
-            df = pd.concat([df, targets.reset_index(drop=True)], axis=1)
+        df, artifacts, response = fit_preprocessing(
+            df, missingValueHandling, featureScaling, encodingCategorical, featureSelection,
+            featureSelectionK, featureSelectionSampleSize, timings
+        )
 
         # Save the preprocessed dataset to the output path
-        df.to_csv(output_path, index=False)
-
-        # Prepare response summaries
-        response = {
-            "missingValueSummary": {
-                "Original Missing Values": original_missing_values.to_dict(),
-                "After Preprocessing": missing_values_after.to_dict()
-            },
-            "featureScalingSummary": scaling_summary,
-            "encodingSummary": encoding_summary,
-            "featureSelectionSummary": feature_selection_summary,
-            "selectedFeatures": selected_features,
-            "preprocessedFilePath": output_path
-        }
+        report_progress("preprocess", "write", 0.85)
+        with timings.stage("write", rows=len(df)):
+            write_table(df, output_path)
+
+            # Persist the fitted pipeline for transform-only runs
+            artifacts_path = artifacts_path or default_artifacts_path(output_path)
+            joblib.dump(artifacts, artifacts_path)
 
+        report_progress("preprocess", "done", 1.0)
+
+        response.update({
+            "preprocessedFilePath": output_path,
+            "artifactsPath": artifacts_path,
+            "memory": {"peak_rss_mb": peak_rss_mb()},
+            "timings": timings.as_dict()
+        })
         return response
 
     except Exception as e:
         return {"error": str(e)}
 
+def apply_preprocessing(df, artifacts):
+    """
+    Transform raw traffic with a pipeline fitted by preprocess_dataset, without refitting.
+
+    Every step runs column-wise over the whole frame. Feature columns missing from df
+    are added as missing values so the fitted imputers fill them; categories unseen at
+    fit time are encoded as -1. Target columns are passed through unchanged.
+    """
+    df = df.set_axis(df.columns.str.strip().str.lower(), axis=1)
+
+    target_columns = [col for col in df.columns if col in ['attack_cat', 'label']]
+    targets = df[target_columns] if target_columns else None
+
+    numeric_cols = artifacts["numeric_cols"]
+    non_numeric_cols = artifacts["non_numeric_cols"]
+    features = df.reindex(columns=numeric_cols + non_numeric_cols)
+    replace_infinite(features)
+
+    if artifacts["numeric_imputer"] is not None and numeric_cols:
+        features[numeric_cols] = artifacts["numeric_imputer"].transform(features[numeric_cols])
+    if artifacts["categorical_imputer"] is not None and non_numeric_cols:
+        features[non_numeric_cols] = artifacts["categorical_imputer"].transform(features[non_numeric_cols])
+
+    for col, classes in artifacts["label_encoders"].items():
+        features[col] = pd.Categorical(features[col], categories=classes).codes
+
+    shift = artifacts["feature_shift"]
+    if shift:
+        shift_cols = list(shift)
+        features[shift_cols] = features[shift_cols] - pd.Series(shift)
+
+    selected_features = artifacts["selected_features"]
+    if selected_features:
+        features = features[selected_features]
+        if artifacts["scaler"] is not None:
+            features = pd.DataFrame(
+                artifacts["scaler"].transform(features), columns=selected_features, index=features.index
+            )
+
+    if targets is not None:
+        features = pd.concat([features, targets], axis=1)
+    return features
+
+def transform_dataset(dataset_path, artifacts_path, output_path):
+    """Apply a previously fitted preprocessing pipeline to a new dataset."""
+    try:
+        timings = StageTimings()
+        with timings.stage("load_artifacts"):
+            artifacts = joblib.load(artifacts_path)
+        report_progress("transform", "load", 0.0)
+        with timings.stage("load"):
+            df = read_table(dataset_path, optimize=True)
+        timings.add_rows("load", len(df))
+        with timings.stage("transform", rows=len(df)):
+            df = apply_preprocessing(df, artifacts)
+        report_progress("transform", "write", 0.8, rows=len(df))
+        with timings.stage("write", rows=len(df)):
+            write_table(df, output_path)
+        report_progress("transform", "done", 1.0)
+
+        return {
+            "selectedFeatures": artifacts["selected_features"],
+            "transformedRows": int(len(df)),
+            "preprocessedFilePath": output_path,
+            "artifactsPath": artifacts_path,
+            "memory": {"peak_rss_mb": peak_rss_mb()},
+            "timings": timings.as_dict()
+        }
+
+    except Exception as e:
+        return {"error": str(e)}
+
 if __name__ == "__main__":
-    dataset_path = sys.argv[1]
-    options = json.loads(sys.argv[2])
-    output_path = sys.argv[3]
+    parser = argparse.ArgumentParser(description="Preprocess a dataset.")
+    parser.add_argument("dataset_path")
+    parser.add_argument("options", nargs="?", default="{}",
+                        help="JSON preprocessing options (not used with --transform)")
+    parser.add_argument("output_path")
+    parser.add_argument("--artifacts",
+                        help="Fitted pipeline path to write (or read with --transform); "
+                             "defaults to <output>_preprocessing_artifacts.pkl")
+    parser.add_argument("--transform", action="store_true",
+                        help="Apply an existing fitted pipeline instead of fitting a new one")
+    args = parser.parse_args()
 
-    result = preprocess_dataset(**options, dataset_path=dataset_path, output_path=output_path)
+    if args.transform:
+        if not args.artifacts:
+            parser.error("--transform requires --artifacts")
+        result = transform_dataset(args.dataset_path, args.artifacts, args.output_path)
+    else:
+        options = json.loads(args.options)
+        result = preprocess_dataset(
+            **options, dataset_path=args.dataset_path, output_path=args.output_path,
+            artifacts_path=args.artifacts
+        )
     print(json.dumps(result))
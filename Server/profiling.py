@@ -0,0 +1,119 @@
+"""
+Process resource measurements reported in the scripts' JSON output.
+
+StageTimings records wall time, row counts and memory per named phase of a run
+(load, impute, predict, ...) and is attached to the output as its "timings" section.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+def peak_rss_mb(include_children=False):
+    """
+    Peak resident set size of this process in MB (optionally also the largest of its
+    finished child processes), or None where it cannot be measured.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows: fall back to psutil when it is installed
+        try:
+            import psutil
+        except ImportError:
+            return None
+        memory = psutil.Process().memory_info()
+        return round(getattr(memory, "peak_wset", memory.rss) / (1024 * 1024), 2)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * scale / (1024 * 1024), 2)
+
+def current_rss_mb():
+    """Current resident set size of this process in MB, or None where it cannot be measured."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 2)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / (1024 * 1024), 2)
+
+_EXHAUSTED = object()
+
+class StageTimings:
+    """
+    Accumulates per-stage timings for one run.
+
+        timings = StageTimings()
+        with timings.stage("load"):
+            df = read_table(path)
+        timings.add_rows("load", len(df))
+        result["timings"] = timings.as_dict()
+
+    A stage entered several times (e.g. once per chunk) sums its time and rows.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def _entry(self, name):
+        return self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rows": None, "rss_mb": None})
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time the enclosed block as stage name; rows are added to the stage's row count."""
+        entry = self._entry(name)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] += time.perf_counter() - start
+            entry["calls"] += 1
+            entry["rss_mb"] = current_rss_mb()
+            if rows is not None:
+                self.add_rows(name, rows)
+
+    def iterate(self, name, iterable):
+        """Yield from iterable, timing each step as stage name and counting len(item) rows."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as entry:
+                item = next(iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                # The final, empty step is not a call
+                entry["calls"] -= 1
+                return
+            self.add_rows(name, len(item))
+            yield item
+
+    def add_rows(self, name, rows):
+        """Add rows to the number processed by stage name."""
+        entry = self._entry(name)
+        entry["rows"] = (entry["rows"] or 0) + int(rows)
+
+    def as_dict(self, include_children=False):
+        """JSON-ready summary: total wall time, peak RSS and every stage in the order first entered."""
+        stages = {}
+        for name, entry in self.stages.items():
+            seconds = entry["seconds"]
+            stages[name] = {
+                "seconds": round(seconds, 4),
+                "calls": entry["calls"],
+                "rows": entry["rows"],
+                "rows_per_sec": round(entry["rows"] / seconds, 1) if entry["rows"] and seconds > 0 else None,
+                "rss_mb": entry["rss_mb"]
+            }
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "peak_rss_mb": peak_rss_mb(include_children),
+            "stages": stages
+        }
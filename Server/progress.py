@@ -0,0 +1,29 @@
+"""
+Structured progress events for long-running pipeline stages.
+
+Events are written to stderr as single lines starting with PROGRESS_PREFIX followed
+by a JSON object, so the Node job runner can pick them out of the regular log output.
+stdout stays reserved for the final JSON result.
+"""
+import sys
+import json
+import time
+
+PROGRESS_PREFIX = "@@PROGRESS "
+
+# Extra fields attached to every event (e.g. the worker request id)
+_context = {}
+
+def set_progress_context(**fields):
+    """Replace the fields added to subsequent events."""
+    _context.clear()
+    _context.update({key: value for key, value in fields.items() if value is not None})
+
+def report_progress(stage, step, fraction=None, **details):
+    """Emit one progress event; fraction is the completed share of the stage (0-1) if known."""
+    event = {"stage": stage, "step": step, "time": round(time.time(), 3), **_context}
+    if fraction is not None:
+        event["fraction"] = round(min(max(fraction, 0.0), 1.0), 4)
+    event.update(details)
+    sys.stderr.write(PROGRESS_PREFIX + json.dumps(event, default=str) + "\n")
+    sys.stderr.flush()
@@ -0,0 +1,37 @@
+"""
+Shared dtype handling for the datasets passed through the pipeline.
+
+Frames are loaded with the smallest types that hold them: float32 for floating
+point columns, the narrowest integer type for integer columns, and pandas
+category for the known categorical columns and other low-cardinality text.
+This roughly halves the memory of a UNSW-NB15 style capture.
+"""
+import numpy as np
+import pandas as pd
+
+# Text columns of the UNSW-NB15 schema that are always stored as category
+CATEGORICAL_COLUMNS = ("proto", "service", "state", "attack_cat")
+
+# Other text columns become category when they have at most this share of distinct values
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+def categorical_dtypes(columns):
+    """read_csv dtype hints for the known categorical columns among columns."""
+    return {col: "category" for col in columns if str(col).strip().lower() in CATEGORICAL_COLUMNS}
+
+def optimize_dtypes(df):
+    """Downcast df's columns in place and return it."""
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_float_dtype(series):
+            if series.dtype != np.float32:
+                df[col] = series.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            is_known = str(col).strip().lower() in CATEGORICAL_COLUMNS
+            if is_known or series.nunique(dropna=True) <= CATEGORY_MAX_UNIQUE_RATIO * max(len(series), 1):
+                df[col] = series.astype("category")
+    return df
@@ -0,0 +1,285 @@
+"""
+Online scoring of flow records with the detection model.
+
+Records arrive as JSON lines on stdin (or on a TCP socket with --port) and are
+scored in micro-batches: a batch is closed when it reaches --batch-size records or
+when its oldest record has waited --max-wait-ms. Features are aligned (and
+optionally preprocessed) exactly as in detection_script.py.
+
+Every record is answered with one JSON line carrying its decision and latency:
+
+    {"id": 7, "Threat": "Attack", "Action": "Block", "Protocol": "tcp", "latency_ms": 1.84}
+
+Records that include a "label" feed running DetectionMetrics counters, returned for
+{"command": "metrics"} and written once more when stdin closes.
+"""
+import io
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+import socketserver
+from collections import deque
+import numpy as np
+import pandas as pd
+from detection_script import (
+    RESULT_COLUMNS, load_model, set_model_threads, prepare_features,
+    confusion_counts, summarize_metrics
+)
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 5.0
+
+# Latencies kept for the percentile figures in the metrics response
+LATENCY_WINDOW = 10_000
+
+_SHUTDOWN = object()
+# Queued by drain(); answered once everything queued before it has been scored
+_DRAIN = object()
+
+class MicroBatcher:
+    """
+    Collects submitted records into batches and scores them on a single thread.
+
+    submit() may be called from any thread; reply(message) is called with each
+    record's decision from the scoring thread.
+    """
+
+    def __init__(self, model, preprocessing_artifacts, batch_size=DEFAULT_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, preprocess=False):
+        self.model = model
+        self.preprocessing_artifacts = preprocessing_artifacts
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.preprocess = preprocess
+        self.queue = queue.Queue()
+
+        # Without preprocessing, records can be put straight into the model's column order
+        has_names = hasattr(model, "feature_names_in_")
+        self.feature_names = list(model.feature_names_in_) if has_names and not preprocess else None
+
+        self.total = 0
+        self.intrusions = 0
+        self.counts = None
+        self.batches = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def submit(self, record, reply):
+        """Queue one record (a dict of flow fields) or command for scoring."""
+        self.queue.put((time.perf_counter(), record, reply))
+
+    def drain(self):
+        """Block until every record submitted so far has been answered."""
+        done = threading.Event()
+        self.queue.put((time.perf_counter(), _DRAIN, lambda _: done.set()))
+        done.wait()
+
+    def shutdown(self):
+        """Score what is queued, then stop run()."""
+        self.queue.put(_SHUTDOWN)
+
+    def run(self):
+        """Score batches until shutdown() is called."""
+        while True:
+            item = self.queue.get()
+            if item is _SHUTDOWN:
+                return
+            batch = [item]
+            deadline = item[0] + self.max_wait
+
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _SHUTDOWN:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self.process(batch)
+            if stop:
+                return
+
+    def process(self, batch):
+        """Answer the commands in batch and score its records as one frame."""
+        records = []
+        for arrived, record, reply in batch:
+            if record is _DRAIN:
+                self.score(records)
+                records = []
+                reply(None)
+            elif record.get("command") == "metrics":
+                # Answered in stream order, after the records queued before it
+                self.score(records)
+                records = []
+                reply(self.metrics())
+            else:
+                records.append((arrived, record, reply))
+        self.score(records)
+
+    def features(self, records):
+        """Model input for a batch of normalised records."""
+        if self.feature_names is not None:
+            # Fast path: fill the matrix straight from the dicts in the model's column
+            # order (missing features are zero, as in align_features)
+            return np.array([[record.get(name, 0) for name in self.feature_names] for record in records],
+                            dtype=np.float32)
+        df = pd.DataFrame.from_records(records)
+        return prepare_features(df, self.model, self.preprocessing_artifacts, self.preprocess,
+                                verbose=self.batches == 0)
+
+    def score(self, records):
+        if not records:
+            return
+
+        # Field names are matched case-insensitively, as for dataset columns
+        rows = [{str(key).strip().lower(): value for key, value in record.items()} for _, record, _ in records]
+        ids = [row.pop("id", None) for row in rows]
+
+        try:
+            predictions = np.asarray(self.model.predict(self.features(rows)))
+        except Exception as e:
+            if len(records) > 1:
+                # Score the records one by one so only the bad ones are rejected
+                logging.warning(f"Failed to score batch of {len(records)} records, retrying one by one: {str(e)}")
+                for record in records:
+                    self.score([record])
+                return
+            logging.error(f"Failed to score record: {str(e)}")
+            for (_, _, reply), record_id in zip(records, ids):
+                reply({"id": record_id, "error": str(e)})
+            return
+
+        self.batches += 1
+        self.total += len(rows)
+        is_attack = predictions == 1
+        self.intrusions += int(is_attack.sum())
+
+        # Labels other than 0/1 (missing, text, ...) are left out of the metrics
+        labels = pd.to_numeric(pd.Series([row.get("label") for row in rows], dtype=object),
+                               errors="coerce").to_numpy(dtype=float)
+        labelled = np.isin(labels, (0, 1))
+        if labelled.any():
+            batch_counts = confusion_counts(labels[labelled], predictions[labelled])
+            self.counts = batch_counts if self.counts is None else self.counts + batch_counts
+
+        done = time.perf_counter()
+        for (arrived, _, reply), record_id, row, attack in zip(records, ids, rows, is_attack):
+            result = {"id": record_id, "Threat": "Attack" if attack else "Normal",
+                      "Action": "Block" if attack else "Allow"}
+            for column, name in RESULT_COLUMNS.items():
+                if column in row:
+                    result[name] = str(row[column])
+            latency_ms = (done - arrived) * 1000
+            self.latencies.append(latency_ms)
+            result["latency_ms"] = round(latency_ms, 3)
+            reply(result)
+
+    def metrics(self):
+        """Running DetectionMetrics plus batch and latency figures."""
+        latency = None
+        if self.latencies:
+            p50, p95, p99 = np.percentile(np.fromiter(self.latencies, dtype=float), [50, 95, 99])
+            latency = {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3)}
+        return {
+            "DetectionMetrics": summarize_metrics(self.total, self.intrusions, self.counts),
+            "Batches": self.batches,
+            "Latency": latency
+        }
+
+def line_writer(stream):
+    """Thread-safe reply function writing each message as a JSON line to stream."""
+    lock = threading.Lock()
+
+    def reply(message):
+        with lock:
+            try:
+                stream.write(json.dumps(message) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                # The client has gone away; its remaining replies are dropped
+                pass
+    return reply
+
+def feed_lines(lines, batcher, reply):
+    """Submit every JSON line from lines; returns False if a shutdown command was seen."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            reply({"id": None, "error": f"Invalid record: {str(e)}"})
+            continue
+        if not isinstance(record, dict):
+            reply({"id": None, "error": "Invalid record: expected a JSON object"})
+            continue
+        if record.get("command") == "shutdown":
+            return False
+        batcher.submit(record, reply)
+    return True
+
+def serve_socket(batcher, host, port):
+    """Accept JSON-line connections on host:port; each connection gets its own replies."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            replies = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+            feed_lines(io.TextIOWrapper(self.rfile, encoding="utf-8"), batcher, line_writer(replies))
+            # Keep the connection open until its queued records have been answered
+            batcher.drain()
+
+    server = socketserver.ThreadingTCPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Scoring flow records on {host}:{port}")
+    return server
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    parser = argparse.ArgumentParser(description="Score flow records online in micro-batches.")
+    parser.add_argument("model_path")
+    parser.add_argument("--artifacts", dest="artifacts_path",
+                        help="Fitted preprocessing pipeline from prepro.py "
+                             "(default: <model>_preprocessing_artifacts.pkl)")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Transform raw records with the fitted preprocessing pipeline before scoring")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Largest number of records scored together")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="Longest time a record waits for its batch to fill")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Model prediction threads (one keeps small batches fastest)")
+    parser.add_argument("--port", type=int, help="Listen on this TCP port instead of reading stdin")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+
+    model, preprocessing_artifacts = load_model(args.model_path, args.artifacts_path)
+    set_model_threads(model, args.threads)
+    batcher = MicroBatcher(model, preprocessing_artifacts, args.batch_size, args.max_wait_ms, args.preprocess)
+
+    if args.port:
+        server = serve_socket(batcher, args.host, args.port)
+        try:
+            batcher.run()
+        except KeyboardInterrupt:
+            server.shutdown()
+        sys.exit(0)
+
+    reply = line_writer(sys.stdout)
+
+    def read_stdin():
+        feed_lines(sys.stdin, batcher, reply)
+        batcher.shutdown()
+
+    threading.Thread(target=read_stdin, daemon=True).start()
+    batcher.run()
+    reply(batcher.metrics())